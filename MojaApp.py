@@ -2,6 +2,31 @@
 import datetime
 import sqlite3
 import os
+import bisect
+import queue
+import threading
+import time
+import hashlib
+import shutil
+import csv
+import json
+import re
+import collections
+import functools
+import contextlib
+import uuid
+import sys
+import traceback
+import argparse
+import fnmatch
+import pathlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # bez Pillow pokazujemy oryginały
+    Image = None
 
 # --- POPRAWIONA OBSŁUGA BAZY DANYCH (KOMPATYBILNA Z ANDROIDEM) ---
 def get_db_path():
@@ -16,110 +41,1631 @@ def get_db_path():
         # Jesteśmy na komputerze - zapisz obok pliku .py
         return "metamorfoza_v7.db"
 
-def init_db():
-    db_path = get_db_path()
-    # Upewnij się, że katalog istnieje (ważne na mobile)
-    try:
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    except: pass
-    
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    cur = conn.cursor()
-    
-    # ... (RESZTA TABEL BEZ ZMIAN) ...
-    cur.execute("""
+def get_photo_dir():
+    # Zdjęcia trzymamy obok bazy - na telefonie w FLET_APP_STORAGE_DATA_DIR
+    storage_path = os.environ.get("FLET_APP_STORAGE_DATA_DIR")
+    return os.path.join(storage_path or ".", "photos")
+
+# --- POMIARY WYDAJNOŚCI (opcjonalne) ---
+# METAMORFOZA_PERF=1 (obok FLET_APP_STORAGE_DATA_DIR) włącza liczenie czasu każdego
+# zapytania SQL, każdego page.update() i głównych akcji. Bez zmiennej nic nie jest mierzone.
+# Raport: przytrzymaj panel "TWOJE MAKRO NA DZIŚ" albo plik perf_stats.json obok bazy.
+PERF_ENV = "METAMORFOZA_PERF"
+PERF_SAMPLES = 512  # ostatnich pomiarów na operację (bufor cykliczny)
+
+class PerfStats:
+    def __init__(self, maxlen=PERF_SAMPLES):
+        self.maxlen = maxlen
+        self.samples = {}  # operacja -> deque czasów w ms
+        self.lock = threading.Lock()
+
+    def record(self, op, ms):
+        buf = self.samples.get(op)
+        if buf is None:
+            with self.lock:
+                buf = self.samples.setdefault(op, collections.deque(maxlen=self.maxlen))
+        buf.append(ms)
+
+    def timed(self, op):
+        def wrap(fn):
+            def timed_fn(*args, **kwargs):
+                t = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(op, (time.perf_counter() - t) * 1000)
+            return timed_fn
+        return wrap
+
+    def summary(self):
+        # p50 / p95 / max z ostatnich PERF_SAMPLES pomiarów, najdroższe (suma) na górze
+        with self.lock:
+            items = list(self.samples.items())
+        rows = []
+        for op, buf in items:
+            s = sorted(buf)
+            if not s: continue
+            rows.append({
+                "op": op, "n": len(s),
+                "p50": s[(len(s) - 1) // 2],
+                "p95": s[min(len(s) - 1, int(len(s) * 0.95))],
+                "max": s[-1], "total": sum(s),
+            })
+        rows.sort(key=lambda r: r["total"], reverse=True)
+        return rows
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+        return path
+
+PERF = PerfStats() if os.environ.get(PERF_ENV) not in (None, "", "0") else None
+
+def perf_timed(op):
+    # Dekorator akcji UI - bez METAMORFOZA_PERF zwraca funkcję bez zmian (zero narzutu)
+    return PERF.timed(op) if PERF else (lambda fn: fn)
+
+def get_perf_path():
+    return os.path.join(os.path.dirname(get_db_path()) or ".", "perf_stats.json")
+
+def sql_op(sql):
+    # Klucz histogramu: zapytanie bez zbędnych białych znaków, przycięte
+    return "sql " + " ".join(sql.split())[:80]
+
+class TimedCursor(sqlite3.Cursor):
+    # Mierzy execute/executemany; pobieranie wierszy (iteracja, fetch*) nie jest wliczane
+    def execute(self, sql, *args):
+        t = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            PERF.record(sql_op(sql), (time.perf_counter() - t) * 1000)
+
+    def executemany(self, sql, *args):
+        t = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            PERF.record(sql_op(sql), (time.perf_counter() - t) * 1000)
+
+class TimedConnection(sqlite3.Connection):
+    # conn.execute() tworzy kursor w C z pominięciem cursor(), więc idzie przez nasz kursor jawnie
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+# --- DZIENNIK: stronicowanie historii ---
+HISTORY_PAGE = 50            # wierszy na jedną stronę (jedno zapytanie)
+HISTORY_MAX_ROWS = 150       # maksymalne okno wierszy trzymanych w UI
+HISTORY_ROW_H = 40           # stała wysokość wiersza (korekta przewijania)
+HISTORY_SCROLL_MARGIN = 400  # px od krawędzi, przy których dociągamy stronę
+
+# --- WYKRES: zakresy i limit punktów ---
+CHART_MAX_POINTS = 120       # tyle punktów czytelnie mieści się na ekranie telefonu
+CHART_RANGES = {"30": 30, "90": 90, "365": 365, "all": None}
+
+def downsample_lttb(points, threshold):
+    # Largest-Triangle-Three-Buckets: redukuje serię (x, y) do `threshold` punktów,
+    # wybierając w każdym kubełku punkt tworzący największy trójkąt z sąsiadami -
+    # szczyty i płaskie odcinki zostają, szum znika.
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Średnia następnego kubełka (trzeci wierzchołek trójkąta)
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        bucket = points[avg_start:avg_end]
+        avg_x = sum(p[0] for p in bucket) / len(bucket)
+        avg_y = sum(p[1] for p in bucket) / len(bucket)
+
+        ax, ay = points[a]
+        max_area = -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                a_next = j
+        sampled.append(points[a_next])
+        a = a_next
+
+    sampled.append(points[-1])
+    return sampled
+
+# julianday('0001-01-01') = 1721425.5, więc julianday(date) - offset == date.toordinal()
+JULIAN_ORDINAL_OFFSET = 1721424.5
+
+LOCAL_USER = "local"  # jedyny użytkownik na telefonie / desktopie (i właściciel danych sprzed v3)
+
+# --- POMIARY CIAŁA (rejestr metryk) ---
+# Każdy pomiar poza wagą i talią to jeden wąski wiersz (user_id, metric_id, day, value)
+# w tabeli metrics - nowa metryka = nowy wpis w METRIC_DEFS, bez zmiany schematu.
+# Waga i talia zostają kolumnami daily_logs - czytają je SeriesStore (jedno zapytanie
+# przy starcie), import/eksport CSV i raport wsadowy, także ze starych baz. Rejestr zna
+# je jako metryki "kolumnowe" (column); zapis samej wagi to wąski UPDATE jednej kolumny.
+MetricDef = collections.namedtuple("MetricDef", "id key label unit low high column")
+METRIC_DEFS = (
+    MetricDef(1, "weight", "Waga", "kg", 0, 500, "weight"),
+    MetricDef(2, "waist", "Talia", "cm", 0, 300, "waist"),
+    MetricDef(3, "hips", "Biodra", "cm", 30, 300, None),
+    MetricDef(4, "body_fat", "Tkanka tłuszczowa", "%", 1, 75, None),
+    MetricDef(5, "kcal", "Zjedzone kalorie", "kcal", 0, 15000, None),
+)
+METRICS = {m.key: m for m in METRIC_DEFS}
+METRICS_BY_ID = {m.id: m for m in METRIC_DEFS}
+EXTRA_METRICS = tuple(m for m in METRIC_DEFS if m.column is None)  # pola formularza poza wagą i talią
+
+# --- MIGRACJE SCHEMATU (PRAGMA user_version) ---
+# Każdy element listy to jedna wersja schematu; baza przechodzi przez brakujące
+# kroki po kolei, każdy w osobnej transakcji. Nowe zmiany = nowy element na końcu.
+MIGRATIONS = [
+    # v1: schemat bazowy (bazy sprzed migracji już go mają - stąd IF NOT EXISTS)
+    [
+        """
         CREATE TABLE IF NOT EXISTS profile (
             id INTEGER PRIMARY KEY,
             start_date TEXT, start_weight REAL, target_weight REAL,
             height REAL, age REAL, intensity REAL, photo_start TEXT
         )
-    """)
-    cur.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS daily_logs (
             id INTEGER PRIMARY KEY,
             date TEXT UNIQUE,
             weight REAL, waist REAL, notes TEXT, photo_path TEXT
         )
-    """)
-    conn.commit()
+        """,
+    ],
+    # v2: dzień jako liczba (date.toordinal()) + indeks pokrywający (day, weight),
+    # dzięki któremu zakresy dat i różnice dni liczy SQLite zamiast strptime w Pythonie.
+    # Zwykła kolumna, nie generowana - SQLite nie traktuje indeksu na kolumnie
+    # generowanej jako pokrywającego. Zapisy podają `day` same, trigger łata resztę.
+    [
+        "ALTER TABLE daily_logs ADD COLUMN day INTEGER",
+        f"UPDATE daily_logs SET day = CAST(julianday(date) - {JULIAN_ORDINAL_OFFSET} AS INTEGER)",
+        "CREATE INDEX IF NOT EXISTS idx_daily_logs_day_weight ON daily_logs(day, weight)",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_logs_day AFTER INSERT ON daily_logs
+        WHEN NEW.day IS NULL
+        BEGIN
+            UPDATE daily_logs SET day = CAST(julianday(NEW.date) - {JULIAN_ORDINAL_OFFSET} AS INTEGER)
+            WHERE id = NEW.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_logs_day_au AFTER UPDATE OF date ON daily_logs
+        BEGIN
+            UPDATE daily_logs SET day = CAST(julianday(NEW.date) - {JULIAN_ORDINAL_OFFSET} AS INTEGER)
+            WHERE id = NEW.id;
+        END
+        """,
+    ],
+    # v3: wielu użytkowników w jednej bazie (wersja web). Dziennik i profil
+    # dostają user_id; UNIQUE(date) -> UNIQUE(user_id, date) wymaga przebudowy tabeli.
+    # Istniejące dane należą do LOCAL_USER.
+    [
+        "DROP TRIGGER IF EXISTS trg_daily_logs_day",
+        "DROP TRIGGER IF EXISTS trg_daily_logs_day_au",
+        f"""
+        CREATE TABLE daily_logs_v3 (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            weight REAL, waist REAL, notes TEXT, photo_path TEXT,
+            day INTEGER,
+            user_id TEXT NOT NULL DEFAULT '{LOCAL_USER}',
+            UNIQUE (user_id, date)
+        )
+        """,
+        f"""
+        INSERT INTO daily_logs_v3 (id, date, weight, waist, notes, photo_path, day, user_id)
+        SELECT id, date, weight, waist, notes, photo_path, day, '{LOCAL_USER}' FROM daily_logs
+        """,
+        "DROP TABLE daily_logs",
+        "ALTER TABLE daily_logs_v3 RENAME TO daily_logs",
+        "CREATE INDEX idx_daily_logs_user_day_weight ON daily_logs(user_id, day, weight)",
+        f"ALTER TABLE profile ADD COLUMN user_id TEXT NOT NULL DEFAULT '{LOCAL_USER}'",
+        "DELETE FROM profile WHERE id NOT IN (SELECT MAX(id) FROM profile)",
+        "CREATE UNIQUE INDEX idx_profile_user ON profile(user_id)",
+        f"""
+        CREATE TRIGGER trg_daily_logs_day AFTER INSERT ON daily_logs
+        WHEN NEW.day IS NULL
+        BEGIN
+            UPDATE daily_logs SET day = CAST(julianday(NEW.date) - {JULIAN_ORDINAL_OFFSET} AS INTEGER)
+            WHERE id = NEW.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_daily_logs_day_au AFTER UPDATE OF date ON daily_logs
+        BEGIN
+            UPDATE daily_logs SET day = CAST(julianday(NEW.date) - {JULIAN_ORDINAL_OFFSET} AS INTEGER)
+            WHERE id = NEW.id;
+        END
+        """,
+    ],
+    # v4: pełnotekstowe wyszukiwanie w notatkach. Indeks FTS5 bez własnej kopii tekstu
+    # (content=daily_logs), synchronizowany triggerami. Indeks odzwierciedla każdy
+    # wiersz (także bez notatki), bo 'delete' musi dostać dokładnie to, co zostało dodane.
+    [
+        """
+        CREATE VIRTUAL TABLE notes_fts USING fts5(
+            notes, content='daily_logs', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        "INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')",
+        """
+        CREATE TRIGGER trg_notes_fts_ai AFTER INSERT ON daily_logs
+        BEGIN
+            INSERT INTO notes_fts (rowid, notes) VALUES (NEW.id, NEW.notes);
+        END
+        """,
+        """
+        CREATE TRIGGER trg_notes_fts_ad AFTER DELETE ON daily_logs
+        BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, notes) VALUES ('delete', OLD.id, OLD.notes);
+        END
+        """,
+        """
+        CREATE TRIGGER trg_notes_fts_au AFTER UPDATE OF notes ON daily_logs
+        BEGIN
+            INSERT INTO notes_fts (notes_fts, rowid, notes) VALUES ('delete', OLD.id, OLD.notes);
+            INSERT INTO notes_fts (rowid, notes) VALUES (NEW.id, NEW.notes);
+        END
+        """,
+    ],
+    # v5: dodatkowe pomiary - definicje (wypełniane z METRIC_DEFS w sync_metric_defs)
+    # i wartości. Klucz główny (user_id, metric_id, day) w tabeli WITHOUT ROWID to sam
+    # indeks: seria jednej metryki to jeden zakres klucza, wiersz to kilkanaście bajtów.
+    [
+        """
+        CREATE TABLE metric_defs (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            label TEXT NOT NULL,
+            unit TEXT NOT NULL
+        )
+        """,
+        f"""
+        CREATE TABLE metrics (
+            user_id TEXT NOT NULL DEFAULT '{LOCAL_USER}',
+            metric_id INTEGER NOT NULL REFERENCES metric_defs(id),
+            day INTEGER NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (user_id, metric_id, day)
+        ) WITHOUT ROWID
+        """,
+        # Wszystkie pomiary dnia (formularz dnia, eksport)
+        "CREATE INDEX idx_metrics_user_day ON metrics(user_id, day)",
+    ],
+]
+
+def migrate_db(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for v in range(version, len(MIGRATIONS)):
+        try:
+            conn.execute("BEGIN")
+            for sql in MIGRATIONS[v]:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {v + 1}")
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+    sync_metric_defs(conn)
+
+def sync_metric_defs(conn):
+    # Rejestr z kodu -> metric_defs; nowa metryka w METRIC_DEFS nie potrzebuje migracji
+    with conn:
+        conn.executemany("""
+            INSERT INTO metric_defs (id, key, label, unit) VALUES (?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET key=excluded.key, label=excluded.label, unit=excluded.unit
+        """, [(m.id, m.key, m.label, m.unit) for m in METRIC_DEFS])
+
+def metric_series(conn, user_id, metric, since_day=None):
+    # (dni, wartości) jednej metryki od since_day, rosnąco po dniu, jako tablice NumPy.
+    # Metryki z tabeli czytają jeden zakres klucza (user_id, metric_id, day) - bez
+    # sortowania i bez dotykania innych metryk; kolumnowe idą po indeksie (user_id, day, ...)
+    m = METRICS[metric]
+    if m.column:
+        rows = conn.execute(f"""
+            SELECT day, {m.column} FROM daily_logs
+            WHERE user_id = ? AND day >= ? AND {m.column} > 0 ORDER BY day ASC
+        """, (user_id, since_day or 0))
+    else:
+        rows = conn.execute("""
+            SELECT day, value FROM metrics
+            WHERE user_id = ? AND metric_id = ? AND day >= ? ORDER BY day ASC
+        """, (user_id, m.id, since_day or 0))
+    data = np.array(rows.fetchall(), dtype=float).reshape(-1, 2)
+    return data[:, 0].astype(np.int64), data[:, 1]
+
+# --- MAGAZYN ZDJĘĆ (adresowany treścią) + MINIATURY ---
+THUMB_DAY = (100, 100)      # podgląd w dzienniku
+THUMB_FINAL = (150, 200)    # porównanie START / FINAŁ
+THUMB_SCALE = 2             # miniatury w 2x - ostre na ekranach o dużej gęstości
+
+class PhotoStore:
+    # Oryginały kopiujemy do photos/<ab>/<sha256>.<ext>, więc to samo zdjęcie
+    # wybrane dwa razy zajmuje miejsce raz, a ścieżka w bazie nie znika, gdy
+    # użytkownik przeniesie plik w galerii. Miniatury (JPEG) powstają w osobnym
+    # wątku i są cache'owane na dysku w photos/thumbs.
+    def __init__(self, root):
+        self.root = root
+        self.thumbs_dir = os.path.join(root, "thumbs")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="photo-thumbs")
+        self.in_progress = set()
+        self.lock = threading.Lock()
+
+    def import_file(self, src_path):
+        # Zwraca ścieżkę kopii w magazynie (istniejącą, jeśli treść już była)
+        h = hashlib.sha256()
+        with open(src_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        ext = os.path.splitext(src_path)[1].lower() or ".jpg"
+        dst = os.path.join(self.root, digest[:2], digest + ext)
+        if not os.path.exists(dst):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp = dst + ".tmp"
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, dst)  # atomowo - nigdy nie zostaje pół pliku pod docelową nazwą
+        return dst
+
+    def _key(self, path):
+        # W magazynie nazwa pliku to już hash treści; starsze wpisy (surowe ścieżki
+        # z pickera) rozpoznajemy po ścieżce, rozmiarze i dacie modyfikacji
+        if os.path.dirname(os.path.dirname(os.path.abspath(path))) == os.path.abspath(self.root):
+            return os.path.splitext(os.path.basename(path))[0]
+        st = os.stat(path)
+        return hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode()).hexdigest()
+
+    def thumbnail(self, path, size, on_ready):
+        # Zwraca ścieżkę miniatury, jeśli już jest na dysku. W przeciwnym razie
+        # zleca jej wygenerowanie w tle, zwraca None i woła później on_ready(src).
+        if Image is None or not os.path.exists(path):
+            return path
+        thumb = os.path.join(self.thumbs_dir, f"{self._key(path)}_{size[0]}x{size[1]}.jpg")
+        if os.path.exists(thumb):
+            return thumb
+        self.executor.submit(self._make_thumbnail, path, thumb, size, on_ready)
+        return None
+
+    def _make_thumbnail(self, path, thumb, size, on_ready):
+        with self.lock:
+            if thumb in self.in_progress: return
+            self.in_progress.add(thumb)
+        try:
+            if not os.path.exists(thumb):
+                box = (size[0] * THUMB_SCALE, size[1] * THUMB_SCALE)
+                with Image.open(path) as img:
+                    img.draft("RGB", box)  # JPEG dekodowany od razu w zmniejszonej skali
+                    img = ImageOps.exif_transpose(img).convert("RGB")
+                    img = ImageOps.fit(img, box)  # przycięcie jak fit="cover"
+                    os.makedirs(self.thumbs_dir, exist_ok=True)
+                    img.save(thumb + ".tmp", "JPEG", quality=85)
+                os.replace(thumb + ".tmp", thumb)
+            on_ready(thumb)
+        except Exception:
+            on_ready(path)  # uszkodzony / nieobsługiwany plik - pokaż oryginał
+        finally:
+            with self.lock:
+                self.in_progress.discard(thumb)
+
+_photo_stores = {}
+_photo_stores_lock = threading.Lock()
+
+def get_photo_store(root=None):
+    # Jeden magazyn na katalog w procesie - sesje web dzielą wątek miniatur
+    # i nie generują tej samej miniatury dwa razy naraz
+    root = root or get_photo_dir()
+    with _photo_stores_lock:
+        store = _photo_stores.get(root)
+        if store is None:
+            store = _photo_stores[root] = PhotoStore(root)
+    return store
+
+def connect_db(db_path):
+    conn = sqlite3.connect(db_path, check_same_thread=False,
+                           factory=TimedConnection if PERF else sqlite3.Connection)
+    # WAL: odczyty nie czekają na zapis, a commit nie robi fsync całej bazy.
+    # synchronous=NORMAL jest w WAL bezpieczne (najwyżej tracimy ostatni commit przy awarii zasilania).
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-8000")  # ~8 MB
+    conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
+# --- WSPÓLNA PULA POŁĄCZEŃ (wersja web: wiele sesji, jedna baza) ---
+# W trybie web main(page) działa raz na sesję przeglądarki - zamiast połączenia na
+# sesję wszystkie sesje procesu korzystają z jednej ograniczonej puli. Zapisy idą
+# po kolei (write_lock), więc sesje nie walczą o blokadę pliku; SQLITE_BUSY od
+# innego procesu ponawiamy z rosnącym odstępem.
+DB_POOL_SIZE = 8          # połączeń na proces, niezależnie od liczby sesji
+DB_POOL_TIMEOUT = 10      # s czekania na wolne połączenie
+DB_BUSY_RETRIES = 5
+DB_BUSY_BACKOFF = 0.05    # s, podwajane przy każdej próbie
+USER_ID_KEY = "metamorfoza.user_id"
+
+def is_busy_error(ex):
+    return isinstance(ex, sqlite3.OperationalError) and (
+        getattr(ex, "sqlite_errorcode", None) in (5, 6)  # SQLITE_BUSY, SQLITE_LOCKED (Python 3.11+)
+        or "locked" in str(ex) or "busy" in str(ex))
+
+class ConnectionPool:
+    def __init__(self, db_path, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self.idle = queue.LifoQueue()  # ostatnio używane połączenie ma ciepły cache stron
+        self.slots = threading.BoundedSemaphore(size)
+        self.write_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        if not self.slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise sqlite3.OperationalError("database is busy: connection pool exhausted")
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = connect_db(self.db_path)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self.idle.put(conn)
+        finally:
+            self.slots.release()
+
+    @contextlib.contextmanager
+    def writing(self):
+        # Połączenie z otwartą transakcją zapisu (BEGIN IMMEDIATE) - commit na wyjściu
+        with self.write_lock, self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.commit()
+            except:
+                conn.rollback()
+                raise
+
+    def write(self, statements):
+        # statements: lista (sql, params) w jednej transakcji, ponawianej gdy baza zajęta
+        for attempt in range(DB_BUSY_RETRIES):
+            try:
+                with self.writing() as conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+                return
+            except sqlite3.OperationalError as ex:
+                if not is_busy_error(ex) or attempt == DB_BUSY_RETRIES - 1:
+                    raise
+                time.sleep(DB_BUSY_BACKOFF * 2 ** attempt)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path=None):
+    # Jedna pula na plik bazy w procesie; pierwsza sesja uruchamia migracje
+    db_path = db_path or get_db_path()
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            if os.path.dirname(db_path):
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            pool = ConnectionPool(db_path)
+            with pool.connection() as conn:
+                migrate_db(conn)
+            _pools[db_path] = pool
+    return pool
+
+def close_pool(db_path=None):
+    # Zamyka pulę pliku (np. przed usunięciem bazy); następne get_pool otworzy nową
+    db_path = db_path or get_db_path()
+    with _pools_lock:
+        pool = _pools.pop(db_path, None)
+    if pool:
+        pool.close()
+
+class Repository:
+    # Dostęp do danych jednego użytkownika: każde zapytanie dostaje user_id,
+    # połączenie jest pożyczane z puli tylko na czas odczytu / zapisu
+    def __init__(self, pool, user_id=LOCAL_USER):
+        self.pool = pool
+        self.user_id = user_id
+
+    def read(self, sql, params=()):
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def read_one(self, sql, params=()):
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def connection(self):
+        return self.pool.connection()
+
+    def write(self, statements):
+        self.pool.write(statements)
+
+    def import_file(self, path):
+        # import_data otwiera własną transakcję - tu tylko kolejka zapisów procesu
+        with self.pool.write_lock, self.pool.connection() as conn:
+            return import_data(conn, path, self.user_id)
+
+    def export_file(self, path):
+        with self.pool.connection() as conn:
+            return export_data(conn, path, self.user_id)
+
+def get_user_id(page):
+    # Web: każda przeglądarka dostaje losowy identyfikator w client_storage, który
+    # oddziela jej dane od innych sesji (to podział danych, nie logowanie).
+    # Telefon / desktop: jeden użytkownik.
+    if not page.web:
+        return LOCAL_USER
+    user_id = page.client_storage.get(USER_ID_KEY)
+    if not user_id:
+        user_id = uuid.uuid4().hex
+        page.client_storage.set(USER_ID_KEY, user_id)
+    return user_id
+
+# --- ZAPIS W TLE (WRITE-BEHIND) ---
+WRITE_BATCH_DELAY = 0.25  # s - tyle zbieramy kolejne zmiany przed jednym commitem
+
+class DbWriter:
+    # Wątek zapisu sesji (połączenie pożycza z puli na czas commitu). Startuje przy
+    # pierwszej zmianie i kończy się na close() - rozłączona sesja web nie trzyma
+    # wątku, a po powrocie kolejny submit uruchamia nowy. UI wrzuca zmiany
+    # do kolejki i od razu wraca. Zmiany z jednego okna WRITE_BATCH_DELAY idą w jednej
+    # transakcji, a kolejne edycje tego samego klucza (np. dnia) są scalane - zapisuje
+    # się tylko ostatnia. Po commicie wołamy on_commit(klucze, błąd). Nieudana paczka
+    # nie wraca do kolejki - on_commit dostaje błąd i odtwarza stan z bazy.
+    _FLUSH = object()
+    _CLOSE = object()
+
+    def __init__(self, pool, on_commit=None):
+        self.pool = pool
+        self.on_commit = on_commit
+        self.queue = queue.Queue()
+        self.pending = {}  # klucz -> (statements, value) jeszcze nie zapisane
+        self.lock = threading.Lock()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.thread = None  # None = brak wątku (jeszcze nie było zapisu albo po close)
+
+    def submit(self, key, statements, value=None):
+        # statements: lista (sql, params); value: to, co mają widzieć odczyty do czasu commitu
+        op = (statements, value)
+        with self.lock:
+            self.pending[key] = op
+            self.idle.clear()
+            self.queue.put((key, op))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self.thread.start()
+
+    def peek(self, key):
+        # (True, value) jeśli klucz czeka na zapis - odczyty nie widzą go jeszcze w bazie
+        with self.lock:
+            op = self.pending.get(key)
+        return (True, op[1]) if op else (False, None)
+
+    def flush(self, timeout=5):
+        # Zapisz natychmiast (bez czekania na okno) i poczekaj aż wszystko trafi na dysk
+        with self.lock:
+            if self.thread is None:  # bez wątku nic nie czeka na zapis
+                return True
+            self.queue.put(self._FLUSH)
+        return self.idle.wait(timeout)
+
+    def close(self, timeout=5):
+        # Zapisuje kolejkę i kończy wątek; kolejny submit uruchomi nowy
+        with self.lock:
+            thread = self.thread
+            if thread is None:
+                return
+            self.queue.put(self._CLOSE)
+        thread.join(timeout)
+
+    def _run(self):
+        closing = False
+        while True:
+            batch = {}
+            item = self.queue.get()
+            deadline = time.monotonic() + WRITE_BATCH_DELAY
+            while True:
+                if item is self._CLOSE:
+                    closing = True
+                    break
+                if item is self._FLUSH:
+                    break
+                key, op = item
+                batch[key] = op  # późniejsza edycja tego samego klucza wygrywa
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+            if closing:
+                with self.lock:
+                    # submit po close() trafił do tej samej kolejki - wtedy pracujemy dalej
+                    if self.queue.empty():
+                        self.thread = None
+                        return
+                closing = False
+
+    def _commit(self, batch):
+        error = None
+        try:
+            # jedna transakcja na całą paczkę
+            self.pool.write([stmt for statements, _ in batch.values() for stmt in statements])
+        except Exception as ex:  # np. sqlite3.Error albo brak wolnego połączenia w puli
+            error = ex
+        with self.lock:
+            for key, op in batch.items():
+                # Nowsza edycja mogła przyjść w trakcie zapisu - ta zostaje w kolejce
+                if self.pending.get(key) is op:
+                    del self.pending[key]
+            if not self.pending:
+                self.idle.set()
+        if self.on_commit:
+            # Wyjątek w callbacku UI nie może zabić wątku - kolejne zapisy utknęłyby w kolejce
+            try:
+                self.on_commit(list(batch), error)
+            except Exception:
+                traceback.print_exc()
+
+# --- PAMIĘĆ PODRĘCZNA DNI (nawigacja strzałkami) ---
+DAY_CACHE_SIZE = 366    # dni trzymanych w pamięci (LRU)
+DAY_PREFETCH = 7        # przy chybieniu dociągamy ±tyle dni jednym zapytaniem
+
+class DayCache:
+    # LRU: "YYYY-MM-DD" -> (weight, waist, notes, photo_path) albo None, gdy dzień
+    # nie ma wpisu (też zapamiętane - puste dni nie pytają bazy ponownie).
+    # loader(od, do) zwraca wiersze (date, weight, waist, notes, photo_path) z zakresu.
+    # Ten sam mechanizm trzyma dodatkowe pomiary dnia (metric_cache w main).
+    def __init__(self, loader, capacity=DAY_CACHE_SIZE, window=DAY_PREFETCH):
+        self.loader = loader
+        self.capacity = capacity
+        self.window = window
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, day):
+        key = day.strftime("%Y-%m-%d")
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return self._prefetch(day)
+
+    def _prefetch(self, day):
+        days = [day + datetime.timedelta(days=d) for d in range(-self.window, self.window + 1)]
+        keys = [d.strftime("%Y-%m-%d") for d in days]
+        found = {r[0]: tuple(r[1:]) for r in self.loader(keys[0], keys[-1])}
+        with self.lock:
+            # Sąsiedzi nie nadpisują tego, co już jest (mogło zostać unieważnione i odświeżone)
+            for key in keys:
+                if key not in self.entries:
+                    self.entries[key] = found.get(key)
+            center = keys[self.window]
+            self.entries[center] = found.get(center)
+            self.entries.move_to_end(center)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            return self.entries[center]
+
+    def get_range(self, first, last):
+        # Wszystkie wpisy z zakresu dat jednym zapytaniem (np. strona dziennika):
+        # {"YYYY-MM-DD": wiersz}; trafiają też do LRU, puste dni nie są zapamiętywane
+        found = {r[0]: tuple(r[1:]) for r in self.loader(first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d"))}
+        with self.lock:
+            for key, row in found.items():
+                self.entries[key] = row
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return found
+
+    def invalidate(self, date_str):
+        with self.lock:
+            self.entries.pop(date_str, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# --- SERIA DNI W PAMIĘCI (NumPy) ---
+class SeriesStore:
+    # Wszystkie dni z wpisem, posortowane po dniu: numer dnia (date.toordinal())
+    # i wartości liczbowe w tablicach NumPy z zapasem pojemności (brak pomiaru = NaN).
+    # Ładowana raz przy starcie; wykres, dziennik i statystyki czytają z niej zamiast
+    # z bazy. Notatki i zdjęcia nie są tu trzymane - podaje je leniwie DayCache.
+    # Szukanie dnia to bisekcja (O(log n)), wstawienie przesuwa ogon jednym memmove.
+    FIELDS = ("weight", "waist")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.n = 0
+        self.days = np.empty(0, dtype=np.int64)
+        self.weight = np.empty(0)
+        self.waist = np.empty(0)
+
+    def load(self, rows):
+        # rows: (day, weight, waist) rosnąco po dniu - np. prosto z kursora; 0/NULL -> NaN
+        data = np.array(list(rows), dtype=float).reshape(-1, 3)
+        data[:, 1:][~(data[:, 1:] > 0)] = np.nan
+        with self.lock:
+            self.n = 0
+            self._reserve(len(data))
+            self.n = len(data)
+            self.days[:self.n] = data[:, 0]
+            self.weight[:self.n] = data[:, 1]
+            self.waist[:self.n] = data[:, 2]
+
+    def _reserve(self, size):
+        if size <= len(self.days): return
+        cap = max(size, 2 * len(self.days), 64)
+        for name in ("days",) + self.FIELDS:
+            old = getattr(self, name)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def set_day(self, day, weight, waist):
+        with self.lock:
+            n = self.n
+            i = int(np.searchsorted(self.days[:n], day))
+            if not (i < n and self.days[i] == day):
+                self._reserve(n + 1)
+                for name in ("days",) + self.FIELDS:
+                    arr = getattr(self, name)
+                    arr[i + 1:n + 1] = arr[i:n].copy()
+                self.days[i] = day
+                self.n += 1
+            self.weight[i] = weight if weight and weight > 0 else np.nan
+            self.waist[i] = waist if waist and waist > 0 else np.nan
+
+    def remove_day(self, day):
+        with self.lock:
+            n = self.n
+            i = int(np.searchsorted(self.days[:n], day))
+            if i == n or self.days[i] != day: return
+            for name in ("days",) + self.FIELDS:
+                arr = getattr(self, name)
+                arr[i:n - 1] = arr[i + 1:n]
+            self.n -= 1
+
+    def last_day(self):
+        with self.lock:
+            return int(self.days[self.n - 1]) if self.n else None
+
+    def latest_weight(self):
+        with self.lock:
+            idx = np.flatnonzero(~np.isnan(self.weight[:self.n]))
+            return float(self.weight[idx[-1]]) if len(idx) else None
+
+    def weight_series(self, since_day=None):
+        return self.field_series("weight", since_day)
+
+    def field_series(self, field, since_day=None):
+        # (dni, wartości) z pomiarem `field` od since_day - kopie, bezpieczne poza blokadą
+        with self.lock:
+            i = int(np.searchsorted(self.days[:self.n], since_day)) if since_day is not None else 0
+            days, values = self.days[i:self.n], getattr(self, field)[i:self.n]
+            mask = ~np.isnan(values)
+            return days[mask], values[mask]
+
+    def page(self, before=None, after=None, limit=50):
+        # Strona dziennika malejąco po dniu: [(day, weight, waist)] z None zamiast NaN.
+        # before / after: dzień graniczny (wyłącznie), jak keyset w SQL
+        with self.lock:
+            days = self.days[:self.n]
+            if after is not None:
+                i = int(np.searchsorted(days, after, side="right"))
+                sl = slice(i, min(self.n, i + limit))
+            else:
+                j = int(np.searchsorted(days, before)) if before is not None else self.n
+                sl = slice(max(0, j - limit), j)
+            rows = zip(self.days[sl].tolist(), self.weight[sl].tolist(), self.waist[sl].tolist())
+            return [(d, w if w == w else None, t if t == t else None) for d, w, t in rows][::-1]
+
+# --- SILNIK TRENDU (NumPy) ---
+TREND_ALPHA = 0.1         # wygładzanie wykładnicze na dzień (10%, jak w "The Hacker's Diet")
+TREND_RATE_WINDOW = 28    # dni, z których liczymy regresję tempa zmian
+TREND_MIN_POINTS = 5      # mniej pomiarów w oknie = tempo niewiarygodne
+TREND_BLOCK_DAYS = 2000   # (1-alpha)^-dni musi zmieścić się w float64
+
+class TrendEngine:
+    # Seria (dzień, waga) posortowana po dniu, trzymana w tablicach NumPy z zapasem
+    # pojemności. Trend to średnia wykładnicza z uwzględnieniem przerw między
+    # pomiarami: T_i = T_{i-1} + (1 - (1-a)^dni) * (w_i - T_{i-1}).
+    # Dopisanie nowego dnia to O(1); edycja dnia w środku przelicza tylko ogon serii.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.n = 0
+        self.days = np.empty(0, dtype=np.int64)
+        self.weights = np.empty(0)
+        self.trend = np.empty(0)
+
+    def load(self, days, weights):
+        # Tablice (dni, wagi) rosnąco po dniu - np. SeriesStore.weight_series()
+        with self.lock:
+            self.n = 0
+            self._reserve(len(days))
+            self.n = len(days)
+            self.days[:self.n] = days
+            self.weights[:self.n] = weights
+            self._recompute_from(0)
+
+    def _reserve(self, size):
+        if size <= len(self.days): return
+        cap = max(size, 2 * len(self.days), 64)
+        for name in ("days", "weights", "trend"):
+            old = getattr(self, name)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def _recompute_from(self, i):
+        # Wektorowo, blokami: w bloku o dniu bazowym b
+        # T_j = r^(d_j-b) * [r^(b-p) * T_prev + cumsum(c_k * w_k * r^-(d_k-b))]
+        n = self.n
+        if i >= n: return
+        r = 1.0 - TREND_ALPHA
+        if i == 0:
+            prev_day, prev_trend = self.days[0], self.weights[0]
+        else:
+            prev_day, prev_trend = self.days[i - 1], self.trend[i - 1]
+        while i < n:
+            end = i + int(np.searchsorted(self.days[i:n], self.days[i] + TREND_BLOCK_DAYS, side="right"))
+            d = self.days[i:end]
+            w = self.weights[i:end]
+            gaps = np.diff(d, prepend=prev_day)
+            c = 1.0 - r ** gaps
+            e = (d - d[0]).astype(float)
+            acc = r ** float(d[0] - prev_day) * prev_trend + np.cumsum(c * w * r ** -e)
+            self.trend[i:end] = r ** e * acc
+            prev_day, prev_trend = d[-1], self.trend[end - 1]
+            i = end
+
+    def set_day(self, day, weight):
+        # weight=None (lub 0) usuwa pomiar z danego dnia
+        with self.lock:
+            n = self.n
+            i = int(np.searchsorted(self.days[:n], day))
+            exists = i < n and self.days[i] == day
+            if not weight:
+                if not exists: return
+                self.days[i:n - 1] = self.days[i + 1:n]
+                self.weights[i:n - 1] = self.weights[i + 1:n]
+                self.n -= 1
+            elif exists:
+                self.weights[i] = weight
+            else:
+                self._reserve(n + 1)
+                self.days[i + 1:n + 1] = self.days[i:n].copy()
+                self.weights[i + 1:n + 1] = self.weights[i:n].copy()
+                self.days[i] = day
+                self.weights[i] = weight
+                self.n += 1
+            if i == self.n - 1 and i > 0 and weight:
+                # Nowy / zmieniony ostatni dzień - jeden krok rekurencji zamiast przeliczania
+                gap = self.days[i] - self.days[i - 1]
+                prev = self.trend[i - 1]
+                self.trend[i] = prev + (1.0 - (1.0 - TREND_ALPHA) ** gap) * (self.weights[i] - prev)
+            else:
+                self._recompute_from(i)
+
+    def latest(self):
+        with self.lock:
+            return float(self.trend[self.n - 1]) if self.n else None
+
+    def rate(self):
+        # Tempo zmian [kg/dzień]: regresja liniowa pomiarów z ostatnich TREND_RATE_WINDOW dni
+        with self.lock:
+            n = self.n
+            if n < TREND_MIN_POINTS: return None
+            last = self.days[n - 1]
+            i = int(np.searchsorted(self.days[:n], last - TREND_RATE_WINDOW))
+            if n - i < TREND_MIN_POINTS: return None
+            x = (self.days[i:n] - last).astype(float)
+            slope, _ = np.polyfit(x, self.weights[i:n], 1)
+            return float(slope)
+
+    def days_to(self, target):
+        # Empiryczny czas do celu przy obecnym tempie; None gdy tempo prowadzi w złą stronę
+        current, rate = self.latest(), self.rate()
+        if current is None or not rate: return None
+        days = (target - current) / rate
+        return int(np.ceil(days)) if days >= 0 else None
+
+    def series(self, since_day):
+        # (dni, trend) od since_day - kopie, bezpieczne poza blokadą
+        with self.lock:
+            i = int(np.searchsorted(self.days[:self.n], since_day))
+            return self.days[i:self.n].copy(), self.trend[i:self.n].copy()
+
+# --- PROGNOZA DZIEŃ PO DNIU (wszystkie tryby diety naraz) ---
+DIET_INTENSITIES = (0.10, 0.14, 0.20)   # opcje st_intensity
+ACTIVITY_FACTOR = 1.4                   # TDEE = BMR * 1.4
+KCAL_PER_KG_LOSS = 7000                 # 7000 zamiast 7700 - uwzględnia utratę wody/glikogenu
+KCAL_PER_KG_GAIN = 5000
+MASS_SURPLUS = 0.10                     # nadwyżka na masie (niezależna od trybu)
+PROJECTION_MAX_DAYS = 3650              # dłużej nie prognozujemy
+PROJECTION_CHECKPOINTS = (28, 84)       # waga po 4 i 12 tygodniach
+
+@functools.lru_cache(maxsize=64)
+def project_intensities(weight, target, height, age, reduce, intensities=DIET_INTENSITIES):
+    # Każdego dnia BMR (Mifflin-St Jeor) liczony jest od bieżącej wagi, więc deficyt
+    # maleje razem z nią: w[t+1] = w[t] -+ TDEE(w[t]) * i / kcal_na_kg. To rekurencja
+    # liniowa w[t+1] = r*w[t] + q, której dokładne rozwiązanie w[t] = f + (w0 - f) * r^t
+    # (f = -c/10: waga, przy której TDEE spadłoby do zera) daje całą ścieżkę dzień po
+    # dniu dla wszystkich intensywności jedną operacją NumPy - bez pętli po dniach.
+    # Wynik jest w cache'u (klucz = profil + zaokrąglona waga), ekran ustawień go nie liczy.
+    i = np.asarray(intensities, dtype=float)
+    c = 6.25 * height - 5 * age + 5          # BMR = 10 * w + c
+    f = -c / 10
+    if reduce:
+        k = ACTIVITY_FACTOR * i / KCAL_PER_KG_LOSS
+        r = 1 - 10 * k
+        kcal = lambda w: (10 * w + c) * ACTIVITY_FACTOR * (1 - i)
+        done = weight <= target
+    else:
+        k = np.full_like(i, ACTIVITY_FACTOR * MASS_SURPLUS / KCAL_PER_KG_GAIN)
+        r = 1 + 10 * k
+        kcal = lambda w: np.full_like(i, (10 * w + c) * ACTIVITY_FACTOR * (1 + MASS_SURPLUS))
+        done = weight >= target
+
+    if done or weight <= f:
+        days = np.zeros_like(i)
+    else:
+        # Intensywność 0 (r == 1): waga stoi w miejscu - cel poza horyzontem prognozy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            days = np.ceil(np.log((target - f) / (weight - f)) / np.log(r))
+        days = np.where((k == 0) | ~np.isfinite(days), PROJECTION_MAX_DAYS, np.minimum(days, PROJECTION_MAX_DAYS))
+
+    t = np.asarray(PROJECTION_CHECKPOINTS, dtype=float)
+    path = f + (weight - f) * r[:, None] ** t[None, :]          # (intensywności, punkty)
+    path = np.maximum(path, target) if reduce else np.minimum(path, target)
+    if done:
+        path[:] = weight
+
+    kcal_start, kcal_end = kcal(weight), kcal(target if not done else weight)
+    return tuple({
+        "intensity": float(i[n]),
+        "days": int(days[n]),
+        "kcal_start": int(kcal_start[n]),
+        "kcal_end": int(kcal_end[n]),
+        "checkpoints": tuple(zip(PROJECTION_CHECKPOINTS, path[n].round(1).tolist())),
+    } for n in range(len(i)))
+
+def projection_days(weight, target, height, age, reduce, intensity):
+    # Dni do celu dla jednej intensywności - z tego samego cache'u co ekran ustawień
+    intensities = tuple(sorted(set(DIET_INTENSITIES) | {intensity}))
+    for p in project_intensities(round(weight, 1), target, height, age, reduce, intensities):
+        if p["intensity"] == intensity:
+            return p["days"]
+
+# --- STATYSTYKI PULPITU (bez UI) ---
+def compute_stats(start_w, target_w, height, age, intensity, current_w=None, trend=None):
+    # Kalorie, tryb, postęp i prognozy dla jednego profilu - liczy je pulpit i raport wsadowy.
+    # current_w: ostatni pomiar (brak = waga startowa); trend: TrendEngine z serią wag albo None
+    current_w = current_w or start_w
+    # Do kalorii i prognozy bierzemy wygładzony trend - dzienne wahania wody go nie ruszają
+    trend_w = (trend.latest() if trend else None) or current_w
+
+    # BMR
+    bmr = (10 * trend_w) + (6.25 * height) - (5 * age) + 5
+    tdee = bmr * 1.4
+
+    result = {
+        "tdee": int(tdee),
+        "current_weight": current_w,
+        "target_weight": target_w,
+        "diff_total": abs(start_w - target_w),
+        "diff_done": abs(start_w - current_w),
+        "trend_weight": trend_w,
+        "rate": trend.rate() if trend else None,
+        "days_left_trend": trend.days_to(target_w) if trend else None,
+        # Metamorfoza zakończona
+        "goal_reached": (target_w < start_w and current_w <= target_w) or (target_w > start_w and current_w >= target_w)
+    }
+
+    if target_w < start_w: # REDUKCJA
+        deficit = tdee * intensity
+        result["calories"] = int(tdee - deficit)
+        result["mode"] = "Redukcja"
+        result["mode_color"] = "green" if intensity <= 0.15 else "red"
+    else: # MASA
+        surplus = tdee * 0.10
+        result["calories"] = int(tdee + surplus)
+        result["mode"] = "Masa"
+        result["mode_color"] = "blue"
+
+    # Prognoza dzień po dniu - deficyt maleje razem z wagą (project_intensities)
+    result["days_left"] = projection_days(trend_w, target_w, height, age, target_w < start_w, intensity)
+    result["progress"] = min(1.0, result["diff_done"] / result["diff_total"]) if result["diff_total"] > 0 else 0
+    return result
+
+# --- RAPORT WSADOWY (wiele baz, JSON Lines) ---
+# Backend trzyma osobną bazę na użytkownika:
+#   python MojaApp.py --report /srv/metamorfoza/users --out raport.jsonl
+# Każda baza liczona jest w osobnym procesie (wszystkie rdzenie), wynik to jedna linia
+# JSON na profil, wypisywana zaraz po policzeniu - kolejność linii = kolejność ukończenia.
+REPORT_IN_FLIGHT = 4   # plików w locie na proces - pamięć nie rośnie z liczbą baz
+
+def report_db(path):
+    # Raport dla każdego profilu w jednej bazie; błąd pliku = jedna linia z "error".
+    # Tylko do odczytu i bez migracji - starsze wersje schematu czytamy tak, jak są
+    try:
+        conn = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            user_col = "user_id" if version >= 3 else f"'{LOCAL_USER}'"
+            day_col = "day" if version >= 2 else f"CAST(julianday(date) - {JULIAN_ORDINAL_OFFSET} AS INTEGER)"
+            profiles = conn.execute(f"""
+                SELECT {user_col}, start_weight, target_weight, height, age, intensity FROM profile
+            """).fetchall()
+            reports = []
+            for user_id, *p in profiles:
+                data = np.array(conn.execute(f"""
+                    SELECT {day_col}, weight FROM daily_logs
+                    WHERE {user_col} = ? AND weight > 0 ORDER BY {day_col} ASC
+                """, (user_id,)).fetchall(), dtype=float).reshape(-1, 2)
+                trend = TrendEngine()
+                trend.load(data[:, 0], data[:, 1])
+                stats = compute_stats(*p, current_w=float(data[-1, 1]) if len(data) else None, trend=trend)
+                del stats["mode_color"]
+                start_w, target_w, height, age, _ = p
+                reports.append({
+                    "path": path,
+                    "user_id": user_id,
+                    "entries": len(data),
+                    "last_date": datetime.date.fromordinal(int(data[-1, 0])).isoformat() if len(data) else None,
+                    **stats,
+                    "projections": project_intensities(round(stats["trend_weight"], 1), target_w, height, age,
+                                                       target_w < start_w),
+                })
+            return reports
+        finally:
+            conn.close()
+    except Exception as ex:  # jeden zły plik nie może przerwać raportu tysięcy baz
+        return [{"path": path, "error": f"{type(ex).__name__}: {ex}"}]
+
+def iter_report_paths(root, pattern):
+    # Bazy pod root (rekurencyjnie) w stałej kolejności - generator, bez listy tysięcy ścieżek
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(fnmatch.filter(filenames, pattern)):
+            yield os.path.join(dirpath, name)
+
+def run_report(root, out, workers=None, pattern=None):
+    # Liczy report_db dla każdej bazy w puli procesów i strumieniuje linie do `out`.
+    # Zwraca liczbę wypisanych linii
+    workers = workers or os.cpu_count() or 1
+    pattern = pattern or os.path.basename(get_db_path())
+
+    def emit(done):
+        lines = 0
+        for fut in done:
+            path = futures.pop(fut)
+            try:
+                records = fut.result()
+            except Exception as ex:  # proces roboczy padł (np. brak pamięci) - linia z błędem
+                records = [{"path": path, "error": f"{type(ex).__name__}: {ex}"}]
+            for rec in records:
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                lines += 1
+        out.flush()
+        return lines
+
+    written = 0
+    pending = set()
+    futures = {}  # future -> ścieżka (do linii z błędem)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path in iter_report_paths(root, pattern):
+            if len(pending) >= workers * REPORT_IN_FLIGHT:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                written += emit(done)
+            fut = pool.submit(report_db, path)
+            futures[fut] = path
+            pending.add(fut)
+        written += emit(wait(pending).done)
+    return written
+
+# --- IMPORT / EKSPORT (CSV i JSON Lines) ---
+# CSV: sam dziennik (format wymiany z wagami i innymi aplikacjami).
+# JSONL: jeden obiekt na linię - {"type": "profile", ...}, {"type": "log", ...} oraz {"type": "metric", ...};
+# pełna kopia danych, którą da się czytać strumieniowo, linia po linii.
+IMPORT_CHUNK = 2000  # wierszy na jedno executemany
+LOG_FIELDS = ("date", "weight", "waist", "notes", "photo_path")
+PROFILE_FIELDS = ("start_date", "start_weight", "target_weight", "height", "age", "intensity", "photo_start")
+CSV_ALIASES = {
+    "data": "date", "day": "date", "dzien": "date", "dzień": "date",
+    "waga": "weight", "weight (kg)": "weight", "waga (kg)": "weight",
+    "talia": "waist", "talia (cm)": "waist",
+    "notatka": "notes", "notatki": "notes", "note": "notes",
+    "zdjecie": "photo_path", "zdjęcie": "photo_path", "photo": "photo_path",
+}
+DATE_FORMATS = ("%d.%m.%Y", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y")
+# Upsert: puste pola z pliku nie kasują tego, co już jest w bazie
+IMPORT_LOG_SQL = """
+    INSERT INTO daily_logs (user_id, date, day, weight, waist, notes, photo_path)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, date) DO UPDATE SET
+        weight=COALESCE(excluded.weight, weight), waist=COALESCE(excluded.waist, waist),
+        notes=COALESCE(excluded.notes, notes), photo_path=COALESCE(excluded.photo_path, photo_path)
+"""
+METRIC_UPSERT_SQL = """
+    INSERT INTO metrics (user_id, metric_id, day, value) VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, metric_id, day) DO UPDATE SET value=excluded.value
+"""
+
+def parse_import_date(value):
+    value = str(value).strip()
+    try:
+        return datetime.date.fromisoformat(value[:10])  # też "2024-01-01T07:30:00" z wag
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"nieznany format daty: {value!r}")
+
+def parse_import_number(value, low, high):
+    # Pusta wartość = brak pomiaru (None); przecinek dziesiętny akceptowany
+    if value is None or str(value).strip() == "":
+        return None
+    number = float(str(value).strip().replace(",", "."))
+    if not (low <= number <= high):
+        raise ValueError(f"wartość poza zakresem: {number}")
+    return number
+
+def parse_log_record(rec):
+    dt = parse_import_date(rec["date"])
+    return (
+        dt.strftime("%Y-%m-%d"), dt.toordinal(),
+        parse_import_number(rec.get("weight"), 0, 500),
+        parse_import_number(rec.get("waist"), 0, 300),
+        rec.get("notes") or None,
+        rec.get("photo_path") or None,
+    )
+
+def parse_metric_record(rec):
+    # {"type": "metric", "date": ..., "metric": "hips", "value": 98.5} - klucz z rejestru
+    m = METRICS[rec["metric"]]
+    if m.column:
+        raise ValueError(f"{m.key} jest kolumną dziennika")
+    value = parse_import_number(rec.get("value"), m.low, m.high)
+    if value is None:
+        raise ValueError("brak wartości")
+    return m.id, parse_import_date(rec["date"]).toordinal(), value
+
+def parse_profile_record(rec):
+    # Intensywność 0 = brak deficytu: nie ma czego prognozować, taki profil odrzucamy
+    if not parse_import_number(rec["intensity"], 0, 1):
+        raise ValueError("intensywność musi być większa od zera")
+    return (
+        parse_import_date(rec["start_date"]).strftime("%Y-%m-%d"),
+        parse_import_number(rec["start_weight"], 20, 500),
+        parse_import_number(rec["target_weight"], 20, 500),
+        parse_import_number(rec["height"], 50, 300),
+        parse_import_number(rec["age"], 1, 150),
+        parse_import_number(rec["intensity"], 0, 1),
+        rec.get("photo_start") or None,
+    )
+
+def iter_import_records(path):
+    # Generator (typ, rekord) - plik czytany strumieniowo, nigdy w całości
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")  # ";" z polskiego Excela
+            except csv.Error:
+                dialect = csv.excel  # np. jedna kolumna - nie ma czego wykrywać
+            reader = csv.reader(f, dialect)
+            header = [h.strip().lower() for h in next(reader, [])]
+            keys = [CSV_ALIASES.get(h, h) for h in header]
+            if "date" not in keys:
+                raise ValueError("brak kolumny z datą")
+            for row in reader:
+                if row:
+                    yield "log", dict(zip(keys, row))
+        else:
+            for line in f:
+                if not line.strip(): continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    yield "invalid", None
+                    continue
+                if not isinstance(rec, dict):  # poprawny JSON, ale nie obiekt: [1, 2], "x", 5
+                    yield "invalid", None
+                    continue
+                kind = rec.get("type")
+                yield (kind if kind in ("profile", "metric") else "log"), rec
+
+def import_data(conn, path, user_id=LOCAL_USER):
+    # Cały import w jednej transakcji; zwraca {"imported", "skipped", "profile"}
+    result = {"imported": 0, "skipped": 0, "profile": False}
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        batch, metrics = [], []
+        for kind, rec in iter_import_records(path):
+            try:
+                if kind == "invalid":
+                    raise ValueError("niepoprawna linia JSON")
+                if kind == "profile":
+                    values = parse_profile_record(rec)
+                    cur.execute("DELETE FROM profile WHERE user_id = ?", (user_id,))
+                    cur.execute(f"INSERT INTO profile (user_id, {', '.join(PROFILE_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (user_id, *values))
+                    result["profile"] = True
+                    continue
+                if kind == "metric":
+                    metrics.append((user_id, *parse_metric_record(rec)))
+                else:
+                    batch.append((user_id, *parse_log_record(rec)))
+            except (ValueError, TypeError, KeyError, AttributeError):
+                result["skipped"] += 1
+                continue
+            for sql, rows in ((IMPORT_LOG_SQL, batch), (METRIC_UPSERT_SQL, metrics)):
+                if len(rows) >= IMPORT_CHUNK:
+                    cur.executemany(sql, rows)
+                    result["imported"] += len(rows)
+                    rows.clear()
+        for sql, rows in ((IMPORT_LOG_SQL, batch), (METRIC_UPSERT_SQL, metrics)):
+            if rows:
+                cur.executemany(sql, rows)
+                result["imported"] += len(rows)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return result
+
+def export_data(conn, path, user_id=LOCAL_USER):
+    # Wiersze idą prosto z kursora do pliku - bez fetchall(); zwraca liczbę wpisów
+    count = 0
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(LOG_FIELDS)} FROM daily_logs WHERE user_id = ? ORDER BY date ASC", (user_id,))
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            writer = csv.writer(f)
+            writer.writerow(LOG_FIELDS)
+            for row in cur:
+                writer.writerow(["" if v is None else v for v in row])
+                count += 1
+        else:
+            profile = conn.execute(f"SELECT {', '.join(PROFILE_FIELDS)} FROM profile WHERE user_id = ?", (user_id,)).fetchone()
+            if profile:
+                f.write(json.dumps({"type": "profile", **dict(zip(PROFILE_FIELDS, profile))}, ensure_ascii=False) + "\n")
+            for row in cur:
+                f.write(json.dumps({"type": "log", **dict(zip(LOG_FIELDS, row))}, ensure_ascii=False) + "\n")
+                count += 1
+            # Dodatkowe pomiary - tylko JSONL (CSV to format wymiany z wagami: data, waga, talia)
+            cur.execute("SELECT day, metric_id, value FROM metrics WHERE user_id = ? ORDER BY day ASC", (user_id,))
+            for day, metric_id, value in cur:
+                if metric_id not in METRICS_BY_ID: continue
+                f.write(json.dumps({"type": "metric", "date": datetime.date.fromordinal(day).isoformat(),
+                                    "metric": METRICS_BY_ID[metric_id].key, "value": value}, ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+# --- KOPIA ZAPASOWA I PRZYWRACANIE ---
+# Katalog kopii: metamorfoza_backup.db (spójny zrzut przez API backup SQLite),
+# photos/ (zdjęcia w tym samym układzie co magazyn) i manifest.json z listą już
+# skopiowanych zdjęć - kolejna kopia przenosi tylko nowe lub zmienione pliki.
+BACKUP_DB_NAME = "metamorfoza_backup.db"
+BACKUP_PHOTOS = "photos"
+BACKUP_MANIFEST = "manifest.json"
+BACKUP_STEP_PAGES = 256   # stron na krok Connection.backup - między krokami baza jest wolna dla UI
+BACKUP_STAGES = {"db": "Baza danych", "photos": "Zdjęcia", "swap": "Podmiana bazy"}
+
+PHOTO_PATHS_SQL = """
+    SELECT photo_path FROM daily_logs WHERE photo_path <> ''
+    UNION SELECT photo_start FROM profile WHERE photo_start <> ''
+"""
+
+def backup_photo_name(path):
+    # Nazwa w kopii: zdjęcia z magazynu (hash treści) zachowują układ ab/<hash>.ext,
+    # starsze surowe ścieżki z pickera trafiają do legacy/ pod hashem ścieżki
+    name = os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    if len(stem) == 64 and all(ch in "0123456789abcdef" for ch in stem):
+        return f"{stem[:2]}/{name}"
+    return f"legacy/{hashlib.sha1(path.encode()).hexdigest()}{ext.lower()}"
+
+def copy_file_atomic(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst + ".tmp")
+    os.replace(dst + ".tmp", dst)
+
+def read_backup_manifest(backup_dir):
+    try:
+        with open(os.path.join(backup_dir, BACKUP_MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"photos": {}}
+
+def backup_data(pool, backup_dir, progress=None):
+    # progress(etap, ułamek) z BACKUP_STAGES; zwraca {"photos", "copied", "skipped", "missing"}
+    report = progress or (lambda stage, fraction: None)
+    os.makedirs(backup_dir, exist_ok=True)
+    db_dst = os.path.join(backup_dir, BACKUP_DB_NAME)
+    tmp = db_dst + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    # Zrzut bazy krokami po BACKUP_STEP_PAGES stron (pasek postępu). Zapis z innego
+    # połączenia między krokami zaczyna backup od początku, więc na czas zrzutu trzymamy
+    # write_lock: zapisy tego procesu (DbWriter, pula) czekają w swoich wątkach, UI i
+    # odczyty działają dalej. Zapis z innego procesu nadal może zrzut zrestartować.
+    dst = sqlite3.connect(tmp)
+    try:
+        with pool.write_lock, pool.connection() as conn:
+            conn.backup(dst, pages=BACKUP_STEP_PAGES,
+                        progress=lambda status, remaining, total: report("db", 1 - remaining / total if total else 1))
+        dst.execute("PRAGMA journal_mode=DELETE")  # kopia jako jeden plik, bez -wal
+        if dst.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise sqlite3.DatabaseError("zrzut bazy nie przeszedł weryfikacji")
+        photos = [r[0] for r in dst.execute(PHOTO_PATHS_SQL)]
+    finally:
+        dst.close()
+    os.replace(tmp, db_dst)
+
+    done = read_backup_manifest(backup_dir).get("photos", {})
+    result = {"photos": len(photos), "copied": 0, "skipped": 0, "missing": 0}
+    for n, path in enumerate(photos, 1):
+        rel = backup_photo_name(path)
+        target = os.path.join(backup_dir, BACKUP_PHOTOS, *rel.split("/"))
+        try:
+            st = os.stat(path)
+        except OSError:
+            result["missing"] += 1  # plik zniknął z telefonu - w kopii zostaje poprzednia wersja
+            continue
+        entry = done.get(rel)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns and os.path.exists(target):
+            result["skipped"] += 1
+        else:
+            copy_file_atomic(path, target)
+            done[rel] = {"size": st.st_size, "mtime": st.st_mtime_ns}
+            result["copied"] += 1
+        report("photos", n / len(photos))
+
+    manifest = {
+        "version": len(MIGRATIONS),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "photos": done,
+    }
+    manifest_path = os.path.join(backup_dir, BACKUP_MANIFEST)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return result
+
+def restore_data(pool, backup_dir, photo_root, progress=None):
+    # Kopia trafia najpierw do pliku roboczego obok bazy, tam jest sprawdzana,
+    # migrowana i dostaje nowe ścieżki zdjęć - żywa baza zmienia się dopiero
+    # na końcu, przez API backup (bezpieczne przy otwartych połączeniach puli)
+    report = progress or (lambda stage, fraction: None)
+    backup_db = os.path.join(backup_dir, BACKUP_DB_NAME)
+    if not os.path.exists(backup_db):
+        raise FileNotFoundError(f"brak {BACKUP_DB_NAME} w {backup_dir}")
+    staging = pool.db_path + ".restore"
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(staging + suffix):
+            os.remove(staging + suffix)
+
+    stage = sqlite3.connect(staging)
+    try:
+        src = sqlite3.connect(backup_db)
+        try:
+            src.backup(stage, pages=BACKUP_STEP_PAGES,
+                       progress=lambda status, remaining, total: report("db", 1 - remaining / total if total else 1))
+        finally:
+            src.close()
+
+        # Weryfikacja: spójny plik, nie nowszy od aplikacji, schemat doprowadzony do bieżącego
+        if stage.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+            raise sqlite3.DatabaseError("kopia jest uszkodzona")
+        if stage.execute("PRAGMA user_version").fetchone()[0] > len(MIGRATIONS):
+            raise sqlite3.DatabaseError("kopia pochodzi z nowszej wersji aplikacji")
+        migrate_db(stage)
+        stage.execute("SELECT COUNT(*) FROM daily_logs").fetchone()
+
+        # Zdjęcia z kopii do lokalnego magazynu; ścieżki w bazie na ich nowe miejsce
+        photos = [r[0] for r in stage.execute(PHOTO_PATHS_SQL)]
+        moved = []
+        for n, old in enumerate(photos, 1):
+            rel = backup_photo_name(old)
+            src_file = os.path.join(backup_dir, BACKUP_PHOTOS, *rel.split("/"))
+            new = os.path.join(photo_root, *rel.split("/"))
+            if not os.path.exists(new) and os.path.exists(src_file):
+                copy_file_atomic(src_file, new)
+            if new != old and os.path.exists(new):
+                moved.append((new, old))
+            report("photos", n / len(photos))
+        with stage:
+            stage.executemany("UPDATE daily_logs SET photo_path = ? WHERE photo_path = ?", moved)
+            stage.executemany("UPDATE profile SET photo_start = ? WHERE photo_start = ?", moved)
+
+        with pool.write_lock, pool.connection() as conn:
+            stage.backup(conn, pages=BACKUP_STEP_PAGES,
+                         progress=lambda status, remaining, total: report("swap", 1 - remaining / total if total else 1))
+    finally:
+        stage.close()
+        os.remove(staging)
+    return {"photos": len(photos), "relinked": len(moved)}
+
+# --- WYSZUKIWANIE W NOTATKACH (FTS5) ---
+SEARCH_PAGE = 20                 # wyników na stronę
+SEARCH_MARK = ("\x02", "\x03")   # znaczniki trafień w snippet() - nie występują w notatkach
+SEARCH_SNIPPET_TOKENS = 12       # długość fragmentu wokół trafienia (w słowach)
+
+NOTES_SEARCH_SQL = f"""
+    SELECT d.date, snippet(notes_fts, 0, '{SEARCH_MARK[0]}', '{SEARCH_MARK[1]}', '…', {SEARCH_SNIPPET_TOKENS})
+    FROM notes_fts JOIN daily_logs d ON d.id = notes_fts.rowid
+    WHERE notes_fts MATCH ? AND d.user_id = ?
+    ORDER BY notes_fts.rank
+    LIMIT ? OFFSET ?
+"""
+
+def fts_query(text):
+    # Tekst z pola wyszukiwania -> zapytanie FTS5: każde słowo jako fraza z prefiksem
+    # ("rower" znajdzie też "rowerem"), słowa łączone AND. Cudzysłowy, myślniki itp.
+    # z wpisu nie trafiają do składni FTS, więc nie ma błędów składni.
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{w}"*' for w in words)
+
+def split_snippet(snippet):
+    # "a \x02b\x03 c" -> [("a ", False), ("b", True), (" c", False)]
+    parts = []
+    for i, chunk in enumerate(re.split(f"[{SEARCH_MARK[0]}{SEARCH_MARK[1]}]", snippet)):
+        if chunk:
+            parts.append((chunk, i % 2 == 1))
+    return parts
+
+# --- ODŚWIEŻANIE UI (jedno update na zdarzenie) ---
+class UpdateScheduler:
+    # Zamiast pełnego page.update() (diff całej strony razem z wykresem i tabelą)
+    # funkcje oznaczają zmienione kontrolki, a scheduler wysyła je razem jednym
+    # page.update(*kontrolki) w następnym obrocie pętli zdarzeń Flet.
+    # batch() wstrzymuje wysyłkę do końca całej akcji (np. zapis -> pulpit + wykres).
+    def __init__(self, page):
+        self.page = page
+        self.dirty = {}  # id(kontrolki) -> kontrolka, w kolejności oznaczenia
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.held = 0
+
+    def mark(self, *controls):
+        with self.lock:
+            for c in controls:
+                self.dirty[id(c)] = c
+            if self.scheduled or self.held: return
+            self.scheduled = True
+        self.page.loop.call_soon_threadsafe(self.flush)
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self.lock:
+            self.held += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.held -= 1
+                go = not self.held and self.dirty and not self.scheduled
+                if go: self.scheduled = True
+            if go: self.page.loop.call_soon_threadsafe(self.flush)
+
+    def batched(self, fn):
+        def wrapper(*args, **kwargs):
+            with self.batch():
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def flush(self):
+        with self.lock:
+            controls = [c for c in self.dirty.values() if c.page]  # pomijamy jeszcze nie dodane
+            self.dirty.clear()
+            self.scheduled = False
+        if controls:
+            self.page.update(*controls)
+
 def main(page: ft.Page):
     # --- KONFIGURACJA OKNA ---
     page.title = "METAMORFOZA PRO (FIXED)"
     page.theme_mode = ft.ThemeMode.DARK
     page.padding = 10
     
-    conn = init_db()
+    # Wspólna pula połączeń procesu; sesja widzi tylko dane swojego użytkownika
+    repo = Repository(get_pool(), get_user_id(page))
+    user_id = repo.user_id
+    if PERF:
+        page.update = PERF.timed("page.update")(page.update)
+    ui = UpdateScheduler(page)
 
     # --- ZMIENNE STANU ---
     state = {
         "start_date": datetime.date.today(),
         "view_date": datetime.date.today(),
         "profile_loaded": False,
-        "is_goal_reached": False
+        "is_goal_reached": False,
+        "history_built": False,
+        "history_at_head": True,   # okno zaczyna się od najnowszego wpisu
+        "history_at_tail": True,   # okno kończy się na najstarszym wpisie
+        "history_loading": False,
+        "chart_range": "all",
+        "chart_metric": "weight",  # klucz z METRIC_DEFS rysowany na wykresie
+        "stats_built": False,      # zakładka Statystyki budowana przy pierwszym otwarciu
+        "search_query": "",        # bieżące zapytanie FTS5 (po fts_query)
+        "search_offset": 0,        # ile wyników już pokazano
+        "backup_running": False,   # kopia / przywracanie w toku (jedno naraz)
+        "day_row": None,           # (weight, waist, notes, photo) dnia z bazy - zapis tylko przy zmianie
+        "day_metrics": {},         # metric_id -> wartość dodatkowych pomiarów dnia z bazy
+        "day_photo": None          # ścieżka zdjęcia dnia w magazynie (nie miniatura)
     }
+    photo_store = get_photo_store()
+    # Liczby wszystkich dni w pamięci (wykres, dziennik, statystyki); notatki i zdjęcia leniwie z day_cache
+    series = SeriesStore()
+    trend = TrendEngine()
+    day_cache = DayCache(lambda first, last: repo.read("""
+        SELECT date, weight, waist, notes, photo_path FROM daily_logs
+        WHERE user_id = ? AND date BETWEEN ? AND ?
+    """, (user_id, first, last)))
+
+    def load_day_metrics(first, last):
+        # Dodatkowe pomiary z zakresu jednym zapytaniem (indeks user_id, day) jako
+        # wiersze dla DayCache: ("YYYY-MM-DD", {metric_id: wartość})
+        by_day = collections.defaultdict(dict)
+        for day, metric_id, value in repo.read("""
+            SELECT day, metric_id, value FROM metrics WHERE user_id = ? AND day BETWEEN ? AND ?
+        """, (user_id, datetime.date.fromisoformat(first).toordinal(), datetime.date.fromisoformat(last).toordinal())):
+            by_day[day][metric_id] = value
+        return [(datetime.date.fromordinal(day).strftime("%Y-%m-%d"), values) for day, values in by_day.items()]
+
+    metric_cache = DayCache(load_day_metrics)
 
     # --- 2. LOGIKA MATEMATYCZNA (POPRAWIONA) ---
     def calculate_stats():
         if not state["profile_loaded"]: return None
         
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM profile ORDER BY id DESC LIMIT 1")
-        p = cur.fetchone() 
-        
-        cur.execute("SELECT weight FROM daily_logs WHERE weight > 0 ORDER BY date DESC LIMIT 1")
-        w_row = cur.fetchone()
-        current_w = w_row[0] if w_row else p[2]
-        
-        # BMR
-        bmr = (10 * current_w) + (6.25 * p[4]) - (5 * p[5]) + 5
-        tdee = bmr * 1.4 
-        
-        start_w = p[2]
-        target_w = p[3]
-        intensity = p[6]
-        
-        result = {
-            "tdee": int(tdee),
-            "current_weight": current_w,
-            "target_weight": target_w,
-            "diff_total": abs(start_w - target_w),
-            "diff_done": abs(start_w - current_w),
-            "start_photo": p[7]
-        }
-        
-        # Sprawdzenie czy osiągnięto cel (Metamorfoza zakończona)
-        if (target_w < start_w and current_w <= target_w) or (target_w > start_w and current_w >= target_w):
-            state["is_goal_reached"] = True
-        else:
-            state["is_goal_reached"] = False
-
-        if target_w < start_w: # REDUKCJA
-            deficit = tdee * intensity
-            result["calories"] = int(tdee - deficit)
-            result["mode"] = "Redukcja"
-            result["mode_color"] = "green" if intensity <= 0.15 else "red"
-            
-            kg_left = current_w - target_w
-            # ZMIANA: 7000 kcal zamiast 7700 kcal (uwzględnia utratę wody/glikogenu = szybszy wynik)
-            if kg_left <= 0:
-                result["days_left"] = 0
-            else:
-                result["days_left"] = int((kg_left * 7000) / deficit) if deficit > 0 else 999
-        else: # MASA
-            surplus = tdee * 0.10
-            result["calories"] = int(tdee + surplus)
-            result["mode"] = "Masa"
-            result["mode_color"] = "blue"
-            
-            kg_left = target_w - current_w
-            if kg_left <= 0:
-                result["days_left"] = 0
-            else:
-                result["days_left"] = int((kg_left * 5000) / surplus) if surplus > 0 else 999
-                
-        result["progress"] = min(1.0, result["diff_done"] / result["diff_total"]) if result["diff_total"] > 0 else 0
+        # Z bazy tylko profil - ostatnia waga pochodzi z serii w pamięci
+        p = repo.read_one("""
+            SELECT start_weight, target_weight, height, age, intensity, photo_start
+            FROM profile WHERE user_id = ?
+        """, (user_id,))
+        result = compute_stats(*p[:5], current_w=series.latest_weight(), trend=trend)
+        result["start_photo"] = p[5]
+        state["is_goal_reached"] = result["goal_reached"]
         return result
 
     # --- 3. UI - DEKLARACJE ---
@@ -128,6 +1674,7 @@ def main(page: ft.Page):
     txt_dash_kcal = ft.Text("---", size=40, weight="bold", color="yellow")
     txt_dash_mode = ft.Text("---", size=16, color="white70")
     txt_dash_days = ft.Text("---", size=14, color="cyan")
+    txt_dash_trend = ft.Text("", size=14, color="white70")
     pb_dash_prog = ft.ProgressBar(width=None, value=0, color="green", bgcolor="white10", height=10)
     txt_dash_prog_perc = ft.Text("0%", size=12)
     
@@ -160,72 +1707,99 @@ def main(page: ft.Page):
     input_waist = ft.TextField(label="Talia (cm)", width=120, text_align="right")
     input_notes = ft.TextField(label="Notatki (Trening / Samopoczucie)", multiline=True, min_lines=3)
     img_day_preview = ft.Image(src="", width=100, height=100, fit="cover", visible=False, border_radius=8)
+    # Pola dodatkowych pomiarów - z rejestru metryk, nowa metryka pojawia się tu sama
+    metric_inputs = {
+        m.id: ft.TextField(label=f"{m.label} ({m.unit})", width=120, text_align="right")
+        for m in EXTRA_METRICS
+    }
     
     # 3.3 USTAWIENIA
-    st_start_weight = ft.TextField(label="Start Waga (kg)", width=100)
-    st_target_weight = ft.TextField(label="Cel Waga (kg)", width=100)
-    st_height = ft.TextField(label="Wzrost (cm)", width=100)
-    st_age = ft.TextField(label="Wiek", width=100)
+    st_start_weight = ft.TextField(label="Start Waga (kg)", width=100, on_blur=lambda _: refresh_projection())
+    st_target_weight = ft.TextField(label="Cel Waga (kg)", width=100, on_blur=lambda _: refresh_projection())
+    st_height = ft.TextField(label="Wzrost (cm)", width=100, on_blur=lambda _: refresh_projection())
+    st_age = ft.TextField(label="Wiek", width=100, on_blur=lambda _: refresh_projection())
     st_intensity = ft.Dropdown(
         label="Tryb Diety", width=180, value="0.14",
         options=[
             ft.dropdown.Option("0.10", "10% (Bezpieczna)"),
             ft.dropdown.Option("0.14", "14% (Naturalna)"),
             ft.dropdown.Option("0.20", "20% (Agresywna)"),
-        ]
-    )
-    
-    # 3.4 WYKRES (NAPRAWIONY)
-    # Usunięto reserved_size, dodano inteligentne skalowanie w funkcji update
-    chart_plot = ft.LineChart(
-        data_series=[],
-        border=ft.border.all(1, ft.colors.WHITE10),
-        left_axis=ft.ChartAxis(labels_size=10), # Mała czcionka
-        bottom_axis=ft.ChartAxis(labels_interval=1, labels_size=10),
-        horizontal_grid_lines=ft.ChartGridLines(interval=1, color=ft.colors.WHITE10, width=1),
-        min_y=0, max_y=150, 
-        expand=True,
-        tooltip_bgcolor=ft.colors.with_opacity(0.8, ft.colors.BLACK)
-    )
-    
-    history_table = ft.DataTable(
-        columns=[
-            ft.DataColumn(ft.Text("Data")),
-            ft.DataColumn(ft.Text("Waga"), numeric=True),
-            ft.DataColumn(ft.Text("Talia"), numeric=True),
-            ft.DataColumn(ft.Text("Notatka")),
         ],
-        rows=[],
-        border=ft.border.all(1, ft.colors.WHITE10),
-        vertical_lines=ft.border.BorderSide(1, ft.colors.WHITE10),
-        horizontal_lines=ft.border.BorderSide(1, ft.colors.WHITE10),
+        on_change=lambda _: refresh_projection()
     )
+    projection_panel = ft.Column(spacing=4)  # prognoza dla każdego trybu (refresh_projection)
+    
+    # 3.4 WYKRES I DZIENNIK - tworzone dopiero w build_stats_tab() (pierwsze otwarcie zakładki)
+    chart_plot = None
+    history_table = None
+    stats_column = None
+
+    # 3.5 WYSZUKIWARKA NOTATEK (zakładka Statystyki)
+    search_field = ft.TextField(label="Szukaj w notatkach", prefix_icon=ft.icons.SEARCH, dense=True,
+                                on_submit=lambda _: run_search())
+    search_results = ft.Column(spacing=6)
+    search_more = ft.TextButton("Pokaż więcej", visible=False, on_click=lambda _: run_search(more=True))
 
     # --- 4. FUNKCJE POMOCNICZE (FORWARD DECLARATIONS) ---
     def load_daily_entry():
         date_str = state["view_date"].strftime("%Y-%m-%d")
         date_btn_display.value = date_str
         
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM daily_logs WHERE date=?", (date_str,))
-        row = cur.fetchone()
+        # Dzień czekający w kolejce zapisu jest nowszy niż to, co jest w bazie;
+        # resztę podaje pamięć podręczna (sąsiednie dni przychodzą jednym zapytaniem)
+        queued, row = writer.peek(("day", date_str))
+        if not queued:
+            row = day_cache.get(state["view_date"])
         
+        state["day_row"] = row
         if row: 
-            input_weight.value = str(row[2]) if row[2] else ""
-            input_waist.value = str(row[3]) if row[3] else ""
-            input_notes.value = row[4] if row[4] else ""
-            if row[5]:
-                img_day_preview.src = row[5]
-                img_day_preview.visible = True
-            else:
-                img_day_preview.visible = False
+            input_weight.value = str(row[0]) if row[0] else ""
+            input_waist.value = str(row[1]) if row[1] else ""
+            input_notes.value = row[2] if row[2] else ""
+            state["day_photo"] = row[3]
         else:
             input_weight.value = ""
             input_waist.value = ""
             input_notes.value = ""
-            img_day_preview.visible = False
-        page.update()
+            state["day_photo"] = None
+        show_photo(img_day_preview, state["day_photo"], THUMB_DAY)
+
+        # Dodatkowe pomiary - osobne małe wiersze i osobna pamięć podręczna
+        values = (metric_cache.get(state["view_date"]) or ({},))[0]
+        state["day_metrics"] = {}
+        for m in EXTRA_METRICS:
+            queued, value = writer.peek(("metric", date_str, m.id))
+            if not queued:
+                value = values.get(m.id)
+            state["day_metrics"][m.id] = value
+            metric_inputs[m.id].value = f"{value:g}" if value is not None else ""
+        ui.mark(date_btn_display, input_weight, input_waist, input_notes, img_day_preview, *metric_inputs.values())
+
+    def show_photo(img, path, size, placeholder=None):
+        # Ustawia miniaturę zamiast oryginału; jeśli jeszcze jej nie ma, obrazek
+        # pojawi się, gdy wątek miniatur ją wygeneruje
+        img.data = path
+        if not path:
+            if placeholder:
+                img.src = placeholder
+            else:
+                img.visible = False
+            return
+
+        def on_ready(src):
+            if img.data != path: return  # użytkownik zdążył przejść dalej
+            img.src = src
+            img.visible = True
+            ui.mark(img)
+
+        thumb = photo_store.thumbnail(path, size, on_ready)
+        if thumb:
+            img.src = thumb
+            img.visible = True
+        elif not placeholder:
+            img.visible = False
 
+    @ui.batched
     def on_date_change(e):
         if e.control.value:
             state["view_date"] = e.control.value.date()
@@ -248,77 +1822,291 @@ def main(page: ft.Page):
         first_date=first_date_limit, last_date=last_date_limit
     )
     
+    @ui.batched
     def on_file_picked(e):
         if e.files:
-            img_day_preview.src = e.files[0].path
-            img_day_preview.visible = True
+            # W przeglądarce plik nie ma ścieżki na serwerze (path = None) - nie ma czego kopiować
+            if not e.files[0].path:
+                show_message("Zdjęcia można dodawać tylko w aplikacji na telefonie / komputerze", "red")
+                return
+            # Kopia do magazynu aplikacji; w bazie zapiszemy ścieżkę kopii
+            try:
+                state["day_photo"] = photo_store.import_file(e.files[0].path)
+            except OSError:
+                show_message("Nie udało się wczytać zdjęcia", "red")
+                return
+            show_photo(img_day_preview, state["day_photo"], THUMB_DAY)
+            ui.mark(img_day_preview)
             if state["is_goal_reached"]:
-                img_final_end.src = e.files[0].path
-                img_final_end.update()
-            page.update()
+                show_photo(img_final_end, state["day_photo"], THUMB_FINAL)
+                ui.mark(img_final_end)
 
     file_picker = ft.FilePicker(on_result=on_file_picked)
-    
+
+    # Jeden SnackBar w overlay, podmieniamy tylko treść - bez pełnego page.update()
+    snack_bar = ft.SnackBar(ft.Text(""))
+
+    def show_message(text, color):
+        snack_bar.content.value = text
+        snack_bar.bgcolor = color
+        snack_bar.open = True
+        ui.mark(snack_bar)
+
+    def on_import_picked(e):
+        if not e.files: return
+        path = e.files[0].path
+        if not path:  # web: plik zostaje w przeglądarce, serwer nie ma go skąd czytać
+            show_message("Import z pliku działa tylko w aplikacji na telefonie / komputerze", "red")
+            return
+        writer.flush()  # zaległe edycje z UI najpierw, import nadpisze je zgodnie z plikiem
+
+        def run_import():
+            try:
+                result = repo.import_file(path)
+            except (OSError, ValueError, csv.Error, sqlite3.Error) as ex:
+                show_message(f"Import nieudany: {ex}", "red")
+                return
+            state["history_built"] = False
+            day_cache.clear()
+            metric_cache.clear()
+            load_initial_data()
+            show_message(f"Zaimportowano {result['imported']} wpisów (pominięto {result['skipped']})", "green")
+
+        page.run_thread(run_import)
+
+    def on_export_picked(e):
+        if not e.path: return
+        writer.flush()
+
+        def run_export():
+            try:
+                count = repo.export_file(e.path)
+            except (OSError, sqlite3.Error) as ex:
+                show_message(f"Eksport nieudany: {ex}", "red")
+                return
+            show_message(f"Wyeksportowano {count} wpisów", "green")
+
+        page.run_thread(run_export)
+
+    import_picker = ft.FilePicker(on_result=on_import_picked)
+    export_picker = ft.FilePicker(on_result=on_export_picked)
+
+    # KOPIA ZAPASOWA - w wątku w tle, postęp w ustawieniach
+    backup_status = ft.Text("", size=12, color="grey")
+    backup_progress = ft.ProgressBar(value=0, visible=False)
+
+    def set_backup_progress(stage, fraction):
+        backup_status.value = f"{BACKUP_STAGES[stage]}: {int(fraction * 100)}%"
+        backup_progress.value = fraction
+        ui.mark(backup_status, backup_progress)
+
+    def run_backup_job(job, on_done, error_text):
+        # Wspólny przebieg kopii i przywracania: jedno naraz, pasek postępu, wynik w SnackBarze
+        if state["backup_running"]: return
+        state["backup_running"] = True
+        writer.flush()  # zaległe edycje najpierw, żeby trafiły do kopii / nie nadpisały przywróconej bazy
+        backup_progress.value = 0
+        backup_progress.visible = True
+        ui.mark(backup_progress)
+
+        def run():
+            try:
+                result = job()
+            except (OSError, ValueError, sqlite3.Error) as ex:
+                backup_status.value = ""
+                show_message(f"{error_text}: {ex}", "red")
+                return
+            finally:
+                state["backup_running"] = False
+                backup_progress.visible = False
+                ui.mark(backup_progress, backup_status)
+            on_done(result)
+            ui.mark(backup_status)
+
+        page.run_thread(run)
+
+    def on_backup_picked(e):
+        if not e.path: return
+
+        def done(r):
+            backup_status.value = (f"Ostatnia kopia: {datetime.datetime.now():%d.%m.%Y %H:%M} - "
+                                   f"zdjęcia: {r['copied']} nowe, {r['skipped']} bez zmian")
+            if r["missing"]:
+                backup_status.value += f", {r['missing']} brak na urządzeniu"
+            show_message("Kopia zapasowa gotowa", "green")
+
+        run_backup_job(lambda: backup_data(repo.pool, e.path, set_backup_progress), done, "Kopia nieudana")
+
+    def on_restore_picked(e):
+        if not e.path: return
+
+        def close(_):
+            dlg.open = False
+            page.update()
+            page.overlay.remove(dlg)
+
+        def confirm(_):
+            close(_)
+            run_backup_job(lambda: restore_data(repo.pool, e.path, get_photo_dir(), set_backup_progress),
+                           restored, "Przywracanie nieudane")
+
+        @ui.batched
+        def restored(r):
+            backup_status.value = f"Przywrócono kopię z {e.path}"
+            state["history_built"] = False
+            day_cache.clear()
+            metric_cache.clear()
+            load_initial_data()
+            show_message("Dane przywrócone z kopii", "green")
+
+        # Przywrócenie zastępuje wszystkie dane na urządzeniu - pytamy raz
+        dlg = ft.AlertDialog(
+            title=ft.Text("Przywrócić kopię?"),
+            content=ft.Text("Obecne dane na tym urządzeniu zostaną zastąpione danymi z kopii."),
+            actions=[ft.TextButton("Anuluj", on_click=close), ft.TextButton("Przywróć", on_click=confirm)],
+        )
+        page.overlay.append(dlg)
+        dlg.open = True
+        page.update()
+
+    backup_picker = ft.FilePicker(on_result=on_backup_picked)
+    restore_picker = ft.FilePicker(on_result=on_restore_picked)
+
     # Rejestracja w overlay
-    page.overlay.extend([date_picker_main, date_picker_start, file_picker])
+    page.overlay.extend([date_picker_main, date_picker_start, file_picker, import_picker, export_picker,
+                         backup_picker, restore_picker, snack_bar])
 
     # --- 6. FUNKCJE AKTUALIZACJI I ZAPISU ---
 
+    @perf_timed("refresh_dashboard")
     def refresh_dashboard():
         data = calculate_stats()
         if data:
             txt_dash_kcal.value = f"{data['calories']} kcal"
             txt_dash_mode.value = f"Tryb: {data['mode']} (TDEE: {data['tdee']})"
             txt_dash_kcal.color = data['mode_color']
-            txt_dash_days.value = f"Szacowany czas do celu: {data['days_left']} dni"
+            if data["days_left"] >= PROJECTION_MAX_DAYS:
+                txt_dash_days.value = "Szacowany czas do celu: ponad 10 lat"
+            else:
+                txt_dash_days.value = f"Szacowany czas do celu: {data['days_left']} dni"
+            if data["days_left_trend"] is not None:
+                txt_dash_days.value += f" (wg trendu: {data['days_left_trend']} dni)"
+            txt_dash_trend.value = f"Trend: {data['trend_weight']:.1f} kg"
+            if data["rate"] is not None:
+                txt_dash_trend.value += f" ({data['rate'] * 7:+.2f} kg/tydz.)"
             pb_dash_prog.value = data['progress']
             txt_dash_prog_perc.value = f"{int(data['progress']*100)}%"
 
             if state["is_goal_reached"]:
                 goal_panel.visible = True
                 standard_dashboard.visible = False
-                if data["start_photo"]: img_final_start.src = data["start_photo"]
-                else: img_final_start.src = "https://via.placeholder.com/150?text=Brak+Start"
-                
-                if img_day_preview.visible: img_final_end.src = img_day_preview.src
+                show_photo(img_final_start, data["start_photo"], THUMB_FINAL,
+                           placeholder="https://via.placeholder.com/150?text=Brak+Start")
+                if state["day_photo"]: show_photo(img_final_end, state["day_photo"], THUMB_FINAL)
             else:
                 goal_panel.visible = False
                 standard_dashboard.visible = True
         else:
             txt_dash_kcal.value = "Ustaw Profil"
-        page.update()
+        ui.mark(standard_dashboard, goal_panel)
+        refresh_projection()
 
-    def update_charts_tab():
-        if not state["profile_loaded"]: return
-        
-        cur = conn.cursor()
-        cur.execute("SELECT date, weight, waist, notes FROM daily_logs ORDER BY date ASC")
-        rows = cur.fetchall()
-        
-        points = []
-        all_weights = []
-        
+    def refresh_projection():
+        # Prognoza dla wszystkich trybów z bieżących pól ustawień - z cache'u, więc
+        # zmiana trybu w liście od razu pokazuje wynik
         try:
             start_w = float(st_start_weight.value)
-            points.append(ft.LineChartDataPoint(0, start_w))
-            all_weights.append(start_w)
-        except: pass
+            target_w = float(st_target_weight.value)
+            height = float(st_height.value)
+            age = float(st_age.value)
+        except (TypeError, ValueError):
+            lines = [("Uzupełnij profil, aby zobaczyć prognozę", False)]
+        else:
+            weight = trend.latest() or start_w
+            reduce = target_w < start_w
+            selected = float(st_intensity.value or 0)
+            today = datetime.date.today()
+            lines = []
+            for p in project_intensities(round(weight, 1), target_w, height, age, reduce):
+                if p["days"] >= PROJECTION_MAX_DAYS:
+                    when = "ponad 10 lat"
+                else:
+                    when = f"{p['days']} dni ({today + datetime.timedelta(days=p['days']):%d.%m.%Y})"
+                checkpoints = " · ".join(f"{d // 7} tyg.: {w:.1f} kg" for d, w in p["checkpoints"])
+                lines.append((
+                    f"{int(round(p['intensity'] * 100)) if reduce else 'Masa +10'}%: cel za {when}\n"
+                    f"    {p['kcal_start']} → {p['kcal_end']} kcal · {checkpoints}",
+                    reduce and abs(p["intensity"] - selected) < 1e-9
+                ))
+                if not reduce: break  # na masie tryb nie zmienia nadwyżki
 
-        dates_for_table = []
+        # Te same kontrolki Text dostają nowe wartości - do klienta idą tylko zmiany
+        texts = projection_panel.controls
+        del texts[len(lines):]
+        for n, (value, is_selected) in enumerate(lines):
+            if n == len(texts):
+                texts.append(ft.Text(size=12))
+            texts[n].value = value
+            texts[n].weight = "bold" if is_selected else None
+            texts[n].color = "cyan" if is_selected else None
+        ui.mark(projection_panel)
+
+    @perf_timed("update_charts_tab")
+    def update_charts_tab():
+        # Zakładka jeszcze nieotwarta - dane policzymy przy pierwszym wejściu
+        if not state["profile_loaded"] or not state["stats_built"]: return
         
-        for r in rows:
-            dates_for_table.append(r)
-            if r[1] and r[1] > 0:
-                dt = datetime.datetime.strptime(r[0], "%Y-%m-%d").date()
-                days_diff = (dt - state["start_date"]).days
-                if days_diff >= 0:
-                    points.append(ft.LineChartDataPoint(days_diff, r[1]))
-                    all_weights.append(r[1])
+        if not state["history_built"]:
+            build_history_table()
+            ui.mark(history_table)
+
+        last_day = series.last_day()
+
+        # Zakres dni: punkty sprzed startu i tak nie są rysowane, więc wycinamy je z serii
+        # bisekcją; oś X (dni od startu) to jedno odejmowanie na tablicy
+        range_days = CHART_RANGES[state["chart_range"]]
+        start_day = state["start_date"].toordinal()
+        since_day = start_day
+        if range_days and last_day:
+            since_day = max(start_day, last_day - range_days)
+        # Waga i talia z serii w pamięci, pozostałe metryki - zakres indeksu w tabeli metrics
+        metric = METRICS[state["chart_metric"]]
+        if metric.column:
+            m_days, m_values = series.field_series(metric.column, since_day)
+        else:
+            with repo.connection() as conn:
+                m_days, m_values = metric_series(conn, user_id, metric.key, since_day)
+        rows = zip((m_days - start_day).tolist(), m_values.tolist())
+
+        raw = []
+        if metric.key == "weight" and since_day == start_day:
+            try:
+                raw.append((0, float(st_start_weight.value)))
+            except: pass
+        raw.extend(rows)
+
+        # Zakres osi Y z rysowanych punktów (także dla "Wszystko" - dni sprzed startu
+        # nie są na wykresie, więc nie mogą rozciągać osi)
+        bounds = [p[1] for p in raw]
+
+        # Wykres dostaje najwyżej CHART_MAX_POINTS punktów (LTTB zachowuje szczyty)
+        points = [ft.LineChartDataPoint(x, y) for x, y in downsample_lttb(raw, CHART_MAX_POINTS)]
+        if metric.key == "weight":
+            t_days, t_values = trend.series(since_day)
+        else:
+            # Ta sama średnia wykładnicza dla dowolnej metryki - liczona na serii z okna
+            metric_trend = TrendEngine()
+            metric_trend.load(m_days, m_values)
+            t_days, t_values = metric_trend.series(since_day)
+        trend_points = [
+            ft.LineChartDataPoint(x, round(y, 2))
+            for x, y in downsample_lttb(list(zip((t_days - start_day).tolist(), t_values.tolist())), CHART_MAX_POINTS)
+        ]
 
         # --- NAPRAWA WYKRESU (Skalowanie) ---
         if points:
-            min_w = min(all_weights)
-            max_w = max(all_weights)
+            min_w = min(bounds)
+            max_w = max(bounds)
             weight_range = max_w - min_w
             
             # Margines góra/dół
@@ -346,75 +2134,375 @@ def main(page: ft.Page):
                     curved=True, 
                     below_line_bgcolor=ft.colors.with_opacity(0.1, ft.colors.CYAN),
                     point=True
-                )
+                ),
+                # Linia trendu (średnia wykładnicza) na wierzchu pomiarów
+                ft.LineChartData(trend_points, color="orange", stroke_width=2, curved=True)
             ]
-        
+        else:
+            chart_plot.data_series = []
+        ui.mark(chart_plot)
+
+    @ui.batched
+    def on_chart_range_change(e):
+        state["chart_range"] = next(iter(e.control.selected), "all")
+        update_charts_tab()
+
+    @ui.batched
+    def on_chart_metric_change(e):
+        state["chart_metric"] = e.control.value or "weight"
+        update_charts_tab()
+
+    # --- WYSZUKIWANIE W NOTATKACH ---
+    def make_search_result(date_str, snippet):
+        return ft.Container(
+            content=ft.Column([
+                ft.Text(date_str, size=12, weight="bold", color="cyan"),
+                ft.Text(size=13, spans=[
+                    ft.TextSpan(text, ft.TextStyle(weight="bold", color="amber") if hit else None)
+                    for text, hit in split_snippet(snippet)
+                ]),
+            ], spacing=2),
+            padding=8, border_radius=8, bgcolor=ft.colors.WHITE10,
+            on_click=lambda _: open_day(date_str),
+        )
+
+    def run_search(more=False):
+        # Ranking bm25 z FTS5; kolejne strony doklejamy pod spodem ("Pokaż więcej")
+        if not more:
+            state["search_query"] = fts_query(search_field.value or "")
+            state["search_offset"] = 0
+            search_results.controls.clear()
+        query = state["search_query"]
+        rows = []
+        if query:
+            # o jeden więcej niż strona - tak wiemy, czy pokazać "Pokaż więcej"
+            rows = repo.read(NOTES_SEARCH_SQL, (query, user_id, SEARCH_PAGE + 1, state["search_offset"]))
+        search_more.visible = len(rows) > SEARCH_PAGE
+        rows = rows[:SEARCH_PAGE]
+        search_results.controls.extend(make_search_result(*r) for r in rows)
+        state["search_offset"] += len(rows)
+        if query and not search_results.controls:
+            search_results.controls.append(ft.Text("Brak wyników", color="grey"))
+        ui.mark(search_results, search_more)
+
+    @ui.batched
+    def open_day(date_str):
+        # Kliknięcie wyniku: przejście do tego dnia na pulpicie
+        state["view_date"] = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+        load_daily_entry()
+        tabs.selected_index = 0
+        ui.mark(tabs)
+
+    # --- MODEL WIERSZY DZIENNIKA (klucz = data) ---
+    # history_dates: daty rosnąco, history_table.rows: te same wiersze malejąco.
+    # Zapis jednego dnia podmienia tylko jego DataRow, reszta kontrolek zostaje
+    # nietknięta, więc Flet wysyła do klienta wyłącznie zmieniony wiersz.
+    # W pamięci trzymamy tylko okno (max HISTORY_MAX_ROWS) - kolejne strony
+    # dociągamy przy przewijaniu paginacją po kluczu (WHERE date < ?), bez OFFSET.
+    history_rows = {}
+    history_dates = []
+
+    def make_history_row(r):
+        return ft.DataRow(cells=[
+            ft.DataCell(ft.Text(r[0])),
+            ft.DataCell(ft.Text(str(r[1]) if r[1] else "-")),
+            ft.DataCell(ft.Text(str(r[2]) if r[2] else "-")),
+            ft.DataCell(ft.Text(r[3][:30] + "..." if r[3] else "")),
+        ])
+
+    def fetch_history_page(before=None, after=None):
+        # Zwraca wiersze (date, weight, waist, notes) - zawsze malejąco po dacie.
+        # Liczby i kolejność z serii w pamięci, notatki strony jednym zapytaniem z day_cache
+        to_day = lambda d: datetime.date.fromisoformat(d).toordinal() if d else None
+        rows = series.page(before=to_day(before), after=to_day(after), limit=HISTORY_PAGE)
+        if not rows: return []
+        dates = [datetime.date.fromordinal(r[0]) for r in rows]
+        texts = day_cache.get_range(dates[-1], dates[0])
+        result = []
+        for d, (_, w, waist) in zip(dates, rows):
+            key = d.strftime("%Y-%m-%d")
+            queued, row = writer.peek(("day", key))
+            row = row if queued else texts.get(key)
+            result.append((key, w, waist, (row or (None,) * 4)[2]))
+        return result
+
+    def trim_history(from_top):
+        # Zwalnia nadmiarowe wiersze z przeciwnego końca okna; zwraca ich liczbę
+        extra = len(history_dates) - HISTORY_MAX_ROWS
+        if extra <= 0: return 0
+        if from_top:  # najnowsze (góra tabeli)
+            dropped = history_dates[-extra:]
+            del history_dates[-extra:]
+            del history_table.rows[:extra]
+            state["history_at_head"] = False
+        else:  # najstarsze (dół tabeli)
+            dropped = history_dates[:extra]
+            del history_dates[:extra]
+            del history_table.rows[-extra:]
+            state["history_at_tail"] = False
+        for d in dropped:
+            del history_rows[d]
+        return extra
+
+    def build_history_table():
+        history_rows.clear()
+        history_dates.clear()
         history_table.rows.clear()
-        for r in reversed(dates_for_table):
-            history_table.rows.append(
-                ft.DataRow(cells=[
-                    ft.DataCell(ft.Text(r[0])),
-                    ft.DataCell(ft.Text(str(r[1]) if r[1] else "-")),
-                    ft.DataCell(ft.Text(str(r[2]) if r[2] else "-")),
-                    ft.DataCell(ft.Text(r[3][:30] + "..." if r[3] else "")),
-                ])
-            )
-        page.update()
+        rows = fetch_history_page()
+        for r in rows:
+            history_rows[r[0]] = make_history_row(r)
+            history_table.rows.append(history_rows[r[0]])
+        history_dates.extend(r[0] for r in reversed(rows))
+        state["history_at_head"] = True
+        state["history_at_tail"] = len(rows) < HISTORY_PAGE
+        state["history_built"] = True
 
+    def load_older_history():
+        # Dociąga starszą stronę na dół tabeli; zwraca liczbę wierszy zdjętych z góry
+        if state["history_at_tail"] or not history_dates: return 0
+        rows = fetch_history_page(before=history_dates[0])
+        for r in rows:
+            history_rows[r[0]] = make_history_row(r)
+            history_table.rows.append(history_rows[r[0]])
+        history_dates[:0] = [r[0] for r in reversed(rows)]
+        if len(rows) < HISTORY_PAGE:
+            state["history_at_tail"] = True
+        return trim_history(from_top=True)
+
+    def load_newer_history():
+        # Dociąga nowszą stronę na górę tabeli; zwraca liczbę dodanych wierszy
+        if state["history_at_head"] or not history_dates: return 0
+        rows = fetch_history_page(after=history_dates[-1])
+        for r in rows:
+            history_rows[r[0]] = make_history_row(r)
+        history_table.rows[:0] = [history_rows[r[0]] for r in rows]
+        history_dates.extend(r[0] for r in reversed(rows))
+        if len(rows) < HISTORY_PAGE:
+            state["history_at_head"] = True
+        trim_history(from_top=False)
+        return len(rows)
+
+    def on_history_scroll(e):
+        if not state["history_built"] or state["history_loading"]: return
+        state["history_loading"] = True
+        try:
+            # Wiersze mają stałą wysokość, więc po zmianie góry tabeli
+            # korygujemy pozycję przewinięcia, żeby treść nie "skakała"
+            if e.pixels >= e.max_scroll_extent - HISTORY_SCROLL_MARGIN:
+                dropped = load_older_history()
+                if dropped:
+                    stats_column.scroll_to(offset=max(0, e.pixels - dropped * HISTORY_ROW_H), duration=0)
+                ui.mark(history_table)
+            elif e.pixels <= HISTORY_SCROLL_MARGIN and not state["history_at_head"]:
+                added = load_newer_history()
+                if added:
+                    stats_column.scroll_to(offset=e.pixels + added * HISTORY_ROW_H, duration=0)
+                ui.mark(history_table)
+        finally:
+            state["history_loading"] = False
+
+    def sync_history_row(date_str, r):
+        # r = (date, weight, waist, notes) albo None gdy dzień został usunięty
+        if not state["history_built"]: return
+        ui.mark(history_table)
+        i = bisect.bisect_left(history_dates, date_str)
+        exists = i < len(history_dates) and history_dates[i] == date_str
+        pos = len(history_dates) - 1 - i  # indeks w tabeli (kolejność malejąca)
+        if r is None:
+            if exists:
+                history_dates.pop(i)
+                del history_rows[date_str]
+                history_table.rows.pop(pos)
+        elif exists:
+            history_rows[date_str] = make_history_row(r)
+            history_table.rows[pos] = history_rows[date_str]
+        elif (i == 0 and not state["history_at_tail"]) or (i == len(history_dates) and not state["history_at_head"]):
+            # Dzień poza zmaterializowanym oknem - pojawi się przy przewijaniu
+            return
+        else:
+            history_dates.insert(i, date_str)
+            history_rows[date_str] = make_history_row(r)
+            history_table.rows.insert(pos + 1, history_rows[date_str])
+            trim_history(from_top=False)
+
+    @perf_timed("save_day_action")
+    @ui.batched
     def save_day_action(e):
         try:
             date_str = state["view_date"].strftime("%Y-%m-%d")
+            day = state["view_date"].toordinal()
             w = float(input_weight.value) if input_weight.value else 0
             waist = float(input_waist.value) if input_waist.value else 0
             note = input_notes.value
-            photo = img_day_preview.src if img_day_preview.visible else None
-            
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT OR REPLACE INTO daily_logs (date, weight, waist, notes, photo_path)
-                VALUES (?, ?, ?, ?, ?)
-            """, (date_str, w, waist, note, photo))
-            conn.commit()
-            
-            page.snack_bar = ft.SnackBar(ft.Text("Zapisano dane dnia!"), bgcolor="green")
-            page.snack_bar.open = True
-            
-            refresh_dashboard()
-            update_charts_tab()
-            page.update()
+            photo = state["day_photo"]
         except ValueError:
-            page.snack_bar = ft.SnackBar(ft.Text("Błąd: Waga musi być liczbą!"), bgcolor="red")
-            page.snack_bar.open = True
-            page.update()
+            show_message("Błąd: Waga musi być liczbą!", "red")
+            return
+        values = {}
+        for m in EXTRA_METRICS:
+            try:
+                values[m.id] = parse_import_number(metric_inputs[m.id].value, m.low, m.high)
+            except ValueError:
+                show_message(f"Błąd: {m.label} - podaj liczbę od {m.low:g} do {m.high:g} {m.unit}", "red")
+                return
+
+        # Zapis idzie do wątku w tle; tabela historii zmienia się od razu,
+        # a pulpit i wykres odświeżą się w on_db_commit, gdy dane będą na dysku.
+        # Zapisujemy tylko to, co się zmieniło: sam pomiar biodra to jeden mały wiersz
+        # w metrics, sama waga - UPDATE jednej kolumny daily_logs.
+        changed = False
+        old = state["day_row"]
+        old_values = (old[0] or 0, old[1] or 0, old[2] or None, old[3]) if old else (0, 0, None, None)
+        new_values = (w, waist, note or None, photo)
+        if new_values != old_values:
+            changed = True
+            day_cache.invalidate(date_str)
+            if not (w or waist or note or photo):
+                # Pusty formularz = wyczyszczenie dnia
+                writer.submit(("day", date_str), [
+                    ("DELETE FROM daily_logs WHERE user_id=? AND date=?", (user_id, date_str))
+                ], None)
+                state["day_row"] = None
+                sync_history_row(date_str, None)
+                series.remove_day(day)
+            else:
+                queued, _ = writer.peek(("day", date_str))
+                if old and not queued:
+                    # Wiersz jest już w bazie i nic na niego nie czeka - UPDATE tylko zmienionych
+                    # kolumn (sama waga nie przepisuje notatki ani ścieżki zdjęcia)
+                    changes = [(col, value) for col, value, new, prev
+                               in zip(LOG_FIELDS[1:], (w, waist, note, photo), new_values, old_values) if new != prev]
+                    stmt = (f"UPDATE daily_logs SET {', '.join(f'{col}=?' for col, _ in changes)} WHERE user_id=? AND date=?",
+                            (*(value for _, value in changes), user_id, date_str))
+                else:
+                    # Nowy dzień albo poprzednia edycja czeka w kolejce - DbWriter zostawia tylko
+                    # ostatnią operację klucza, więc musi ona nieść cały wiersz.
+                    # UPSERT zamiast INSERT OR REPLACE - REPLACE usuwa wiersz bez wywołania
+                    # triggera DELETE, więc indeks notes_fts rozjechałby się z danymi
+                    stmt = ("""
+                        INSERT INTO daily_logs (user_id, date, day, weight, waist, notes, photo_path)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(user_id, date) DO UPDATE SET
+                            weight=excluded.weight, waist=excluded.waist,
+                            notes=excluded.notes, photo_path=excluded.photo_path
+                    """, (user_id, date_str, day, w, waist, note, photo))
+                writer.submit(("day", date_str), [stmt], (w, waist, note, photo))
+                state["day_row"] = (w, waist, note, photo)
+                series.set_day(day, w, waist)
+                sync_history_row(date_str, (date_str, w, waist, note))
+            trend.set_day(day, w)
+
+        for metric_id, value in values.items():
+            if value == state["day_metrics"].get(metric_id): continue
+            changed = True
+            metric_cache.invalidate(date_str)
+            if value is None:
+                writer.submit(("metric", date_str, metric_id), [
+                    ("DELETE FROM metrics WHERE user_id=? AND metric_id=? AND day=?", (user_id, metric_id, day))
+                ], None)
+            else:
+                writer.submit(("metric", date_str, metric_id), [
+                    (METRIC_UPSERT_SQL, (user_id, metric_id, day, value))
+                ], value)
+            state["day_metrics"][metric_id] = value
+
+        if not changed:
+            show_message("Brak zmian do zapisania", "blue")
 
     def save_profile_action(e):
         try:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM profile")
-            cur.execute("""
-                INSERT INTO profile (start_date, start_weight, target_weight, height, age, intensity)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
+            values = (
                 state["start_date"].strftime("%Y-%m-%d"),
                 float(st_start_weight.value),
                 float(st_target_weight.value),
                 float(st_height.value),
                 float(st_age.value),
                 float(st_intensity.value)
-            ))
-            conn.commit()
-            state["profile_loaded"] = True
-            page.snack_bar = ft.SnackBar(ft.Text("Profil zapisany!"), bgcolor="blue")
-            page.snack_bar.open = True
-            refresh_dashboard()
-            update_charts_tab()
+            )
         except:
-            page.snack_bar = ft.SnackBar(ft.Text("Wypełnij wszystkie pola!"), bgcolor="red")
-            page.snack_bar.open = True
+            show_message("Wypełnij wszystkie pola!", "red")
+            return
+        # Tylko profil tego użytkownika - inne sesje web dzielą tę samą tabelę
+        writer.submit(("profile",), [
+            ("DELETE FROM profile WHERE user_id = ?", (user_id,)),
+            ("""
+                INSERT INTO profile (user_id, start_date, start_weight, target_weight, height, age, intensity)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, *values)),
+        ], values)
+
+    @ui.batched
+    def on_db_commit(keys, error):
+        # Wołane z wątku zapisu, gdy paczka zmian jest już trwała na dysku.
+        # Dni z paczki wypadają z pamięci podręcznej - sąsiednie dociągnięcie w trakcie
+        # zapisu mogło do niej wczytać starą wersję z bazy.
+        for key in keys:
+            if key[0] == "day":
+                day_cache.invalidate(key[1])
+            elif key[0] == "metric":
+                metric_cache.invalidate(key[1])
+        if error:
+            # Seria, trend i dziennik pokazują już zmiany, których nie ma w bazie -
+            # wczytujemy stan od nowa z tego, co faktycznie zostało zapisane
+            show_message(f"Błąd zapisu: {error}", "red")
+            state["history_built"] = False
+            day_cache.clear()
+            metric_cache.clear()
+            load_initial_data()
+            return
+        elif ("profile",) in keys:
+            state["profile_loaded"] = True
+            show_message("Profil zapisany!", "blue")
+        else:
+            show_message("Zapisano dane dnia!", "green")
+        refresh_dashboard()
+        update_charts_tab()
+
+    def on_lifecycle_change(e):
+        # Aplikacja schodzi w tło - Android może ją zabić, więc zapisujemy od razu
+        if e.state in (ft.AppLifecycleState.HIDE, ft.AppLifecycleState.PAUSE, ft.AppLifecycleState.DETACH):
+            writer.flush()
+
+    def show_perf_panel(e):
+        # Ukryty panel pomiarów (tylko z METAMORFOZA_PERF) - przytrzymaj panel makro na pulpicie
+        rows = [ft.Text(f"{'operacja':<40} {'n':>4} {'p50':>7} {'p95':>7} {'max':>7}", font_family="monospace", size=10, weight="bold")]
+        for r in PERF.summary():
+            rows.append(ft.Text(f"{r['op'][:40]:<40} {r['n']:>4} {r['p50']:>7.2f} {r['p95']:>7.2f} {r['max']:>7.2f}",
+                                font_family="monospace", size=10, selectable=True))
+
+        def dump(_):
+            try:
+                show_message(f"Zapisano {PERF.dump(get_perf_path())}", "blue")
+            except Exception as ex:
+                show_message(f"Błąd zapisu pomiarów: {ex}", "red")
+
+        def close(_):
+            dlg.open = False
             page.update()
+            page.overlay.remove(dlg)
+
+        dlg = ft.AlertDialog(
+            title=ft.Text("Pomiary (ms)"),
+            content=ft.Column(rows, scroll="auto", tight=True),
+            actions=[ft.TextButton("Zapisz do pliku", on_click=dump), ft.TextButton("Zamknij", on_click=close)],
+        )
+        page.overlay.append(dlg)
+        dlg.open = True
+        page.update()
+
+    writer = DbWriter(repo.pool, on_commit=on_db_commit)
+    page.on_app_lifecycle_state_change = on_lifecycle_change
+    page.on_disconnect = lambda _: writer.close()  # zapisuje kolejkę; po powrocie sesji wątek wstanie sam
+    def on_close(_):
+        writer.close()
+        if PERF:
+            PERF.dump(get_perf_path())
+
+    page.on_close = on_close
 
     # --- 7. UKŁAD STRONY (LAYOUT) ---
 
+    @perf_timed("change_day")
     def change_day(delta):
         state["view_date"] += datetime.timedelta(days=delta)
         load_daily_entry()
@@ -426,10 +2514,12 @@ def main(page: ft.Page):
             txt_dash_mode,
             ft.Divider(color="white10"),
             ft.Row([txt_dash_prog_perc, pb_dash_prog], alignment="spaceBetween"),
+            txt_dash_trend,
             txt_dash_days
         ]),
         padding=20, border_radius=15, bgcolor=ft.colors.WHITE10, # FIX: colors.surface usunięte
         border=ft.border.all(1, ft.colors.WHITE10),
+        on_long_press=show_perf_panel if PERF else None,
     )
 
     # ZAKŁADKA 1: PULPIT
@@ -454,9 +2544,12 @@ def main(page: ft.Page):
                     
                     ft.Divider(),
                     ft.Row([input_weight, input_waist], alignment="center"),
+                    ft.Row(list(metric_inputs.values()), alignment="center", wrap=True),
                     input_notes,
                     ft.Row([
-                        ft.TextButton("Dodaj zdjęcie", icon=ft.icons.PHOTO_CAMERA, on_click=lambda _: file_picker.pick_files()),
+                        # Web: wybrany plik zostaje w przeglądarce (brak ścieżki) - przycisk ukryty
+                        ft.TextButton("Dodaj zdjęcie", icon=ft.icons.PHOTO_CAMERA, on_click=lambda _: file_picker.pick_files(),
+                                      visible=not page.web),
                         img_day_preview
                     ]),
                     ft.ElevatedButton("ZAPISZ WPIS", on_click=save_day_action, bgcolor="green", color="white", width=1000, height=45)
@@ -469,23 +2562,85 @@ def main(page: ft.Page):
     )
 
     # ZAKŁADKA 2: STATYSTYKI
-    tab_stats = ft.Container(
-        content=ft.Column([
-            ft.Text("HISTORIA WAGI", size=16, weight="bold"),
+    # Start aplikacji zależy tylko od pulpitu - wykres i dziennik (skan całej historii)
+    # powstają przy pierwszym wyborze zakładki, patrz on_tab_change
+    tab_stats = ft.Container(padding=10)
+
+    def build_stats_tab():
+        nonlocal chart_plot, history_table, stats_column
+        # Usunięto reserved_size, dodano inteligentne skalowanie w funkcji update
+        chart_plot = ft.LineChart(
+            data_series=[],
+            border=ft.border.all(1, ft.colors.WHITE10),
+            left_axis=ft.ChartAxis(labels_size=10), # Mała czcionka
+            bottom_axis=ft.ChartAxis(labels_interval=1, labels_size=10),
+            horizontal_grid_lines=ft.ChartGridLines(interval=1, color=ft.colors.WHITE10, width=1),
+            min_y=0, max_y=150, 
+            expand=True,
+            tooltip_bgcolor=ft.colors.with_opacity(0.8, ft.colors.BLACK)
+        )
+        
+        history_table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text("Data")),
+                ft.DataColumn(ft.Text("Waga"), numeric=True),
+                ft.DataColumn(ft.Text("Talia"), numeric=True),
+                ft.DataColumn(ft.Text("Notatka")),
+            ],
+            rows=[],
+            data_row_min_height=HISTORY_ROW_H, data_row_max_height=HISTORY_ROW_H,
+            border=ft.border.all(1, ft.colors.WHITE10),
+            vertical_lines=ft.border.BorderSide(1, ft.colors.WHITE10),
+            horizontal_lines=ft.border.BorderSide(1, ft.colors.WHITE10),
+        )
+
+        chart_range_selector = ft.SegmentedButton(
+            segments=[
+                ft.Segment(value="30", label=ft.Text("30 dni")),
+                ft.Segment(value="90", label=ft.Text("90 dni")),
+                ft.Segment(value="365", label=ft.Text("Rok")),
+                ft.Segment(value="all", label=ft.Text("Wszystko")),
+            ],
+            selected={state["chart_range"]}, allow_empty_selection=False, show_selected_icon=False,
+            on_change=on_chart_range_change
+        )
+
+        chart_metric_selector = ft.Dropdown(
+            options=[ft.dropdown.Option(m.key, f"{m.label} ({m.unit})") for m in METRIC_DEFS],
+            value=state["chart_metric"], width=220, dense=True,
+            on_change=on_chart_metric_change
+        )
+
+        stats_column = ft.Column([
+            ft.Row([ft.Text("HISTORIA POMIARÓW", size=16, weight="bold"), chart_metric_selector],
+                   alignment="spaceBetween"),
+            chart_range_selector,
             ft.Container(
                 content=chart_plot,
                 height=300,
                 padding=10, bgcolor=ft.colors.WHITE10, border_radius=10
             ),
             ft.Divider(),
+            search_field,
+            search_results,
+            search_more,
+            ft.Divider(),
             ft.Text("DZIENNIK SZCZEGÓŁOWY", size=16, weight="bold"),
             ft.Container(
                 content=history_table,
                 bgcolor=ft.colors.WHITE10, border_radius=10, padding=10
             )
-        ], scroll="auto"),
-        padding=10
-    )
+        ], scroll="auto", on_scroll=on_history_scroll, on_scroll_interval=100)
+        tab_stats.content = stats_column
+        state["stats_built"] = True
+        state["history_built"] = False
+        ui.mark(tab_stats)
+
+    @ui.batched
+    def on_tab_change(e):
+        if tabs.selected_index == 1 and not state["stats_built"]:
+            build_stats_tab()
+            update_charts_tab()
 
     # ZAKŁADKA 3: USTAWIENIA
     tab_settings = ft.Container(
@@ -495,12 +2650,37 @@ def main(page: ft.Page):
             ft.Row([st_start_weight, st_target_weight]),
             ft.Row([st_height, st_age]),
             st_intensity,
+            ft.Text("PROGNOZA (dzień po dniu, TDEE spada razem z wagą)", size=12, color="grey"),
+            projection_panel,
             ft.Row([
                 ft.Text("Data Startu:", size=16),
                 ft.IconButton(ft.icons.CALENDAR_MONTH, on_click=lambda _: date_picker_start.pick_date())
             ]),
             ft.Divider(),
-            ft.ElevatedButton("ZAPISZ PROFIL", on_click=save_profile_action, width=1000, height=50)
+            ft.ElevatedButton("ZAPISZ PROFIL", on_click=save_profile_action, width=1000, height=50),
+            ft.Divider(),
+            ft.Text("IMPORT / EKSPORT DANYCH", size=18, weight="bold"),
+            ft.Text("CSV: sam dziennik (np. z wagi). JSONL: pełna kopia z profilem.", size=12, color="grey"),
+            ft.Row([
+                ft.OutlinedButton("Importuj", icon=ft.icons.UPLOAD_FILE,
+                                  on_click=lambda _: import_picker.pick_files(allowed_extensions=["csv", "jsonl"])),
+                ft.OutlinedButton("Eksportuj", icon=ft.icons.DOWNLOAD,
+                                  on_click=lambda _: export_picker.save_file(file_name="metamorfoza.jsonl", allowed_extensions=["jsonl", "csv"])),
+            ]),
+            # Wybór katalogu nie działa w przeglądarce - w wersji web sekcja jest ukryta
+            ft.Column([
+                ft.Divider(),
+                ft.Text("KOPIA ZAPASOWA", size=18, weight="bold"),
+                ft.Text("Baza i zdjęcia do wybranego katalogu. Kolejne kopie dogrywają tylko nowe zdjęcia.", size=12, color="grey"),
+                ft.Row([
+                    ft.OutlinedButton("Utwórz kopię", icon=ft.icons.BACKUP,
+                                      on_click=lambda _: backup_picker.get_directory_path(dialog_title="Katalog kopii")),
+                    ft.OutlinedButton("Przywróć", icon=ft.icons.RESTORE,
+                                      on_click=lambda _: restore_picker.get_directory_path(dialog_title="Katalog z kopią")),
+                ]),
+                backup_progress,
+                backup_status,
+            ], visible=not page.web),
         ], scroll="auto"),
         padding=20
     )
@@ -513,15 +2693,23 @@ def main(page: ft.Page):
             ft.Tab(text="Statystyki", icon=ft.icons.INSERT_CHART, content=tab_stats),
             ft.Tab(text="Ustawienia", icon=ft.icons.SETTINGS, content=tab_settings),
         ],
-        expand=True
+        expand=True,
+        on_change=on_tab_change
     )
     page.add(tabs)
 
     # --- 8. START ---
+    @perf_timed("load_initial_data")
+    @ui.batched
     def load_initial_data():
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM profile ORDER BY id DESC LIMIT 1")
-        p = cur.fetchone()
+        with repo.connection() as conn:
+            cur = conn.cursor()
+            # Jedyny pełny odczyt dziennika: same liczby, bez notatek i ścieżek zdjęć
+            cur.execute("SELECT day, weight, waist FROM daily_logs WHERE user_id = ? ORDER BY day ASC", (user_id,))
+            series.load(cur)
+            cur.execute("SELECT * FROM profile WHERE user_id = ?", (user_id,))
+            p = cur.fetchone()
+        trend.load(*series.weight_series())
         if p:
             state["profile_loaded"] = True
             state["start_date"] = datetime.datetime.strptime(p[1], "%Y-%m-%d").date()
@@ -538,4 +2726,34 @@ def main(page: ft.Page):
 
     load_initial_data()
 
-ft.app(target=main)
\ No newline at end of file
+    # Uchwyty do logiki aplikacji dla benchmark.py (ft.app ignoruje wartość zwracaną)
+    return {
+        "state": state,
+        "writer": writer,
+        "series": series,
+        "load_initial_data": load_initial_data,
+        "refresh_dashboard": refresh_dashboard,
+        "update_charts_tab": update_charts_tab,
+        "save_day_action": save_day_action,
+        "change_day": change_day,
+        "tabs": tabs,
+        "on_tab_change": on_tab_change,
+        "ui": ui,
+        "input_weight": input_weight,
+        "input_waist": input_waist,
+        "input_notes": input_notes,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metamorfoza - aplikacja albo raport wsadowy wielu baz")
+    parser.add_argument("--report", metavar="KATALOG", help="policz statystyki wszystkich baz w katalogu (JSON Lines)")
+    parser.add_argument("--out", help="plik wynikowy raportu (domyślnie standardowe wyjście)")
+    parser.add_argument("--workers", type=int, help="liczba procesów (domyślnie wszystkie rdzenie)")
+    parser.add_argument("--pattern", help="nazwa plików baz (domyślnie metamorfoza_v7.db)")
+    args, _ = parser.parse_known_args()  # resztę argumentów zostawiamy Fletowi
+    if args.report:
+        with open(args.out, "w", encoding="utf-8") if args.out else contextlib.nullcontext(sys.stdout) as out:
+            lines = run_report(args.report, out, args.workers, args.pattern)
+        print(f"Raport: {lines} profili", file=sys.stderr)
+    else:
+        ft.app(target=main)
\ No newline at end of file
@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import flet as ft
+from flet.core.local_connection import LocalConnection
+from flet.core.protocol import CommandEncoder, PageCommandsBatchResponsePayload
+
+import MojaApp
+
+# --- BENCHMARK MOJAAPP (bez telefonu i bez okna) ---
+# Generuje syntetyczne bazy metamorfoza_v7.db, uruchamia na nich main() z atrapą
+# połączenia Flet i mierzy czas, szczytową pamięć oraz to, ile trafia "na kabel"
+# (wywołania update(), dodane kontrolki, zmienione właściwości, bajty JSON).
+#
+#   python benchmark.py                      # 1, 5 i 20 lat, rzadkie i gęste zdjęcia
+#   python benchmark.py --years 5 --repeat 10 --json bench.json
+
+PHOTO_DENSITY = {"sparse": 30, "dense": 1}  # co ile dni wpis ma zdjęcie
+NOTE_EVERY = {"sparse": 7, "dense": 1}      # co ile dni wpis ma notatkę
+NOTE_WORDS = "trening siłownia bieganie rower basen odpoczynek dieta sen stres woda spacer".split()
+STORAGE_ENV = "FLET_APP_STORAGE_DATA_DIR"
+
+
+class BenchConnection(LocalConnection):
+    # Atrapa połączenia: przetwarza komendy jak serwer Flet (nadaje id kontrolkom),
+    # ale zamiast wysyłać - liczy, co zostałoby wysłane do klienta
+    def __init__(self):
+        super().__init__()
+        self.reset()
+
+    def reset(self):
+        self.updates = 0
+        self.added = 0
+        self.props = 0
+        self.bytes = 0
+
+    def send_command(self, session_id, command):
+        return self.send_commands(session_id, [command])
+
+    def send_commands(self, session_id, commands):
+        self.updates += 1
+        results = []
+        for command in commands:
+            result, message = self._process_command(command)
+            if command.name in ["add", "get"]:
+                results.append(result)
+            if message:
+                if command.name == "add":
+                    self.added += len(message.payload.controls)
+                elif command.name == "set":
+                    self.props += len(command.attrs)
+                self.bytes += len(json.dumps(message, cls=CommandEncoder, separators=(",", ":")))
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+
+@contextlib.contextmanager
+def storage_dir(path):
+    # MojaApp bierze katalog danych ze zmiennej środowiskowej - ustawiamy ją tylko
+    # na czas scenariusza i przywracamy poprzednią wartość
+    previous = os.environ.get(STORAGE_ENV)
+    os.environ[STORAGE_ENV] = path
+    try:
+        yield path
+    finally:
+        if previous is None:
+            os.environ.pop(STORAGE_ENV, None)
+        else:
+            os.environ[STORAGE_ENV] = previous
+
+
+def make_photos(photo_dir, count=5):
+    # Kilka prawdziwych zdjęć "z aparatu" w magazynie - bez Pillow tylko ścieżki
+    if MojaApp.Image is None:
+        return [os.path.join(photo_dir, f"brak_{i}.jpg") for i in range(count)]
+    store = MojaApp.PhotoStore(photo_dir)
+    src_dir = os.path.join(os.path.dirname(photo_dir), "aparat")  # sprzątane razem ze scenariuszem
+    os.makedirs(src_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        src = os.path.join(src_dir, f"img_{i}.jpg")
+        MojaApp.Image.new("RGB", (3000, 4000), (40 * i, 120, 200 - 30 * i)).save(src, quality=90)
+        paths.append(store.import_file(src))
+    return paths
+
+
+def generate_db(years, density, seed=7):
+    # Baza z `years` lat codziennych wpisów w bieżącym katalogu danych (storage_dir):
+    # waga błądzi losowo wokół spadającego trendu
+    rng = random.Random(seed)
+    days = years * 365
+    start = datetime.date.today() - datetime.timedelta(days=days - 1)
+    photos = make_photos(MojaApp.get_photo_dir())
+
+    def rows():
+        weight = 105.0
+        for i in range(days):
+            d = start + datetime.timedelta(days=i)
+            weight += rng.gauss(-0.01, 0.35)
+            note = None
+            if i % NOTE_EVERY[density] == 0:
+                note = " ".join(rng.choice(NOTE_WORDS) for _ in range(rng.randint(3, 25)))
+            photo = photos[i % len(photos)] if i % PHOTO_DENSITY[density] == 0 else None
+            yield d.strftime("%Y-%m-%d"), d.toordinal(), round(weight, 1), round(weight * 0.9, 1), note, photo
+
+    # Ta sama pula (i migracje), z której potem korzysta main()
+    with MojaApp.get_pool().writing() as conn:
+        conn.executemany("""
+            INSERT INTO daily_logs (date, day, weight, waist, notes, photo_path)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows())
+        conn.execute("""
+            INSERT INTO profile (start_date, start_weight, target_weight, height, age, intensity)
+            VALUES (?, 105, 80, 180, 35, 0.14)
+        """, (start.strftime("%Y-%m-%d"),))
+
+
+def measure(conn, fn, repeat):
+    # Czas (mediana z `repeat`), potem osobny przebieg pod tracemalloc -
+    # śledzenie pamięci spowalnia kod, więc nie miesza się z pomiarem czasu
+    times = []
+    conn.reset()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    sent = {k: getattr(conn, k) / repeat for k in ("updates", "added", "props", "bytes")}
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"ms_median": statistics.median(times), "ms_max": max(times), "peak_kb": peak / 1024, **sent}
+
+
+def measure_once(conn, fn):
+    # Operacje jednorazowe (zimny start, pierwsze wejście na zakładkę): drugie wywołanie
+    # mierzyłoby już zbudowany stan, więc czas i pamięć pochodzą z jednego przebiegu
+    # (czas zawiera narzut tracemalloc)
+    conn.reset()
+    tracemalloc.start()
+    t = time.perf_counter()
+    fn()
+    ms = (time.perf_counter() - t) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    sent = {k: getattr(conn, k) for k in ("updates", "added", "props", "bytes")}
+    return {"ms_median": ms, "ms_max": ms, "peak_kb": peak / 1024, **sent}
+
+
+def run_scenario(years, density, repeat):
+    # Baza, zdjęcia i miniatury scenariusza znikają razem z katalogiem tymczasowym
+    with tempfile.TemporaryDirectory(prefix=f"bench_{years}y_{density}_", ignore_cleanup_errors=True) as tmp, storage_dir(tmp):
+        generate_db(years, density)
+        try:
+            return measure_scenario(repeat)
+        finally:
+            MojaApp.close_pool()
+
+
+def measure_scenario(repeat):
+    loop = asyncio.new_event_loop()
+    conn = BenchConnection()
+    results = {}
+
+    def on_loop(fn):
+        # UpdateScheduler wysyła zmiany w następnym obrocie pętli Flet - tu ją obracamy ręcznie
+        def run():
+            fn()
+            loop.run_until_complete(asyncio.sleep(0))
+        return run
+
+    # Zimny start: budowa UI + load_initial_data (tak jak przy otwarciu aplikacji)
+    holder = {}
+
+    def cold_start():
+        page = ft.Page(conn, "bench", loop)
+        holder["app"] = MojaApp.main(page)
+        holder["page"] = page
+
+    results["cold_start"] = measure_once(conn, on_loop(cold_start))
+    app = holder["app"]
+    try:
+        measure_app(app, conn, on_loop, repeat, results)
+    finally:
+        app["writer"].close()  # wątek zapisu nie może przeżyć scenariusza (ani błędu w nim)
+        loop.close()
+    return results
+
+
+def measure_app(app, conn, on_loop, repeat, results):
+    # Operacje na działającej aplikacji (po zimnym starcie), wyniki dopisywane do results
+    # Zapis kończy się na wątku zapisu - czekamy też na odświeżenie UI po commicie
+    committed = threading.Event()
+    on_commit = app["writer"].on_commit
+
+    def on_commit_wrapped(keys, error):
+        on_commit(keys, error)
+        committed.set()
+
+    app["writer"].on_commit = on_commit_wrapped
+
+    def save_day():
+        committed.clear()
+        app["input_weight"].value = str(round(random.uniform(80, 90), 1))
+        app["input_notes"].value = "benchmark"
+        app["save_day_action"](None)
+
+    def save_day_durable():
+        save_day()
+        app["writer"].flush()
+        committed.wait(10)
+
+    def open_stats_tab():
+        # Pierwsze wejście na Statystyki - dopiero tu powstaje wykres i dziennik
+        app["tabs"].selected_index = 1
+        app["on_tab_change"](None)
+
+    results["open_stats_tab"] = measure_once(conn, on_loop(open_stats_tab))
+    results["load_initial_data"] = measure(conn, on_loop(app["load_initial_data"]), repeat)
+    results["refresh_dashboard"] = measure(conn, on_loop(app["refresh_dashboard"]), repeat)
+    results["update_charts_tab"] = measure(conn, on_loop(app["update_charts_tab"]), repeat)
+    results["change_day"] = measure(conn, on_loop(lambda: app["change_day"](-1)), repeat)
+    results["save_day_action (handler)"] = measure(conn, on_loop(save_day), repeat)
+    app["writer"].flush()
+    committed.wait(10)
+    results["save_day_action (durable)"] = measure(conn, on_loop(save_day_durable), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gorących ścieżek MojaApp")
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--density", nargs="+", default=["sparse", "dense"], choices=list(PHOTO_DENSITY))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+
+    report = []
+    header = f"{'scenariusz':<14} {'operacja':<28} {'ms med':>8} {'ms max':>8} {'pamięć KB':>10} {'update':>7} {'dodane':>7} {'props':>7} {'bajty':>9}"
+    print(header)
+    print("-" * len(header))
+    for years in args.years:
+        for density in args.density:
+            scenario = f"{years}l/{density}"
+            for op, r in run_scenario(years, density, args.repeat).items():
+                report.append({"years": years, "density": density, "op": op, **r})
+                print(f"{scenario:<14} {op:<28} {r['ms_median']:>8.1f} {r['ms_max']:>8.1f} {r['peak_kb']:>10.0f} "
+                      f"{r['updates']:>7.1f} {r['added']:>7.0f} {r['props']:>7.0f} {r['bytes']:>9.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import json
+
+import MojaApp
+
+# --- TEST IMPORTU (CSV i JSON Lines) ---
+# Złe wiersze są pomijane i liczone, reszta pliku trafia do bazy w jednej transakcji.
+#
+#   python -m pytest -q
+
+
+def open_db(tmp_path):
+    conn = MojaApp.connect_db(str(tmp_path / "metamorfoza_v7.db"))
+    MojaApp.migrate_db(conn)
+    return conn
+
+
+def write_lines(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_jsonl_skips_malformed_lines(tmp_path):
+    conn = open_db(tmp_path)
+    path = write_lines(tmp_path / "dane.jsonl", [
+        json.dumps({"type": "log", "date": "2024-01-01", "weight": 90.5, "notes": "start"}),
+        "{niepoprawny json",
+        "[1, 2]",
+        '"x"',
+        "5",
+        "null",
+        "",
+        json.dumps({"date": "2024-13-45", "weight": 90}),  # zła data
+        json.dumps({"date": "2024-01-02", "weight": 900}),  # poza zakresem
+        json.dumps({"weight": 89}),  # brak daty
+        json.dumps({"type": "metric", "date": "2024-01-02", "metric": "hips", "value": 98.5}),
+        json.dumps({"type": "metric", "date": "2024-01-02", "metric": "nieznana", "value": 1}),
+        json.dumps({"type": "profile", "start_date": "2024-01-01", "start_weight": 92, "target_weight": 80,
+                    "height": 180, "age": 35, "intensity": 0.1}),
+        json.dumps({"date": "03.01.2024", "weight": "89,8", "waist": ""}),
+    ])
+
+    result = MojaApp.import_data(conn, path)
+
+    assert result == {"imported": 3, "skipped": 9, "profile": True}
+    assert conn.execute("SELECT date, day, weight, waist, notes FROM daily_logs ORDER BY date").fetchall() == [
+        ("2024-01-01", 738886, 90.5, None, "start"),
+        ("2024-01-03", 738888, 89.8, None, None),
+    ]
+    assert conn.execute("SELECT metric_id, value FROM metrics").fetchall() == [(MojaApp.METRICS["hips"].id, 98.5)]
+    assert conn.execute("SELECT user_id, target_weight FROM profile").fetchall() == [(MojaApp.LOCAL_USER, 80)]
+    conn.close()
+
+
+def test_import_upserts_without_clearing_fields(tmp_path):
+    conn = open_db(tmp_path)
+    conn.execute("""
+        INSERT INTO daily_logs (user_id, date, day, weight, waist, notes)
+        VALUES ('local', '2024-01-01', 738886, 91, 95, 'moja notatka')
+    """)
+    conn.commit()
+    path = write_lines(tmp_path / "waga.csv", [
+        "Data;Waga (kg);Talia",
+        "01.01.2024;90,4;",
+        "02.01.2024;90,1;94",
+        "jutro;90;94",
+    ])
+
+    assert MojaApp.import_data(conn, path) == {"imported": 2, "skipped": 1, "profile": False}
+    # Ponowny import tego samego pliku nie dubluje wpisów
+    assert MojaApp.import_data(conn, path) == {"imported": 2, "skipped": 1, "profile": False}
+    assert conn.execute("SELECT date, weight, waist, notes FROM daily_logs ORDER BY date").fetchall() == [
+        ("2024-01-01", 90.4, 95, "moja notatka"),
+        ("2024-01-02", 90.1, 94, None),
+    ]
+    conn.execute("INSERT INTO notes_fts (notes_fts, rank) VALUES ('integrity-check', 1)")
+    conn.close()
+
+
+def test_import_is_per_user(tmp_path):
+    conn = open_db(tmp_path)
+    path = write_lines(tmp_path / "dane.jsonl", [json.dumps({"date": "2024-01-01", "weight": 90})])
+
+    MojaApp.import_data(conn, path, user_id="anna")
+    MojaApp.import_data(conn, path, user_id="piotr")
+
+    assert conn.execute("SELECT user_id, date FROM daily_logs ORDER BY user_id").fetchall() == [
+        ("anna", "2024-01-01"), ("piotr", "2024-01-01"),
+    ]
+    conn.close()
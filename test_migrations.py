@@ -0,0 +1,123 @@
+import datetime
+import sqlite3
+import time
+
+import pytest
+
+import MojaApp
+
+# --- TEST MIGRACJI SCHEMATU ---
+# Migracje przebudowują daily_logs (v3) na prawdziwych plikach metamorfoza_v7.db
+# użytkowników - sprawdzamy, że baza w kształcie sprzed migracji przechodzi do
+# najnowszej wersji bez utraty danych.
+#
+#   python -m pytest -q
+
+# Schemat z init_db() sprzed wprowadzenia migracji (PRAGMA user_version = 0)
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS profile (
+        id INTEGER PRIMARY KEY,
+        start_date TEXT, start_weight REAL, target_weight REAL,
+        height REAL, age REAL, intensity REAL, photo_start TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_logs (
+        id INTEGER PRIMARY KEY,
+        date TEXT UNIQUE,
+        weight REAL, waist REAL, notes TEXT, photo_path TEXT
+    )
+    """,
+]
+NOTES = [None, "", "trening siłownia", "Zmieniłem plan — więcej snu", "bieganie 5 km"]
+
+
+def make_baseline_db(path, days=400):
+    conn = sqlite3.connect(path)
+    for sql in BASELINE_SCHEMA:
+        conn.execute(sql)
+    start = datetime.date(2023, 1, 1)
+    rows = []
+    for i in range(days):
+        if i % 9 == 4:
+            continue  # dni bez wpisu
+        d = start + datetime.timedelta(days=i)
+        weight = 0 if i % 11 == 0 else round(100 - i * 0.03, 1)  # 0 = sama talia / notatka
+        rows.append((d.strftime("%Y-%m-%d"), weight, round(90 - i * 0.01, 1),
+                     NOTES[i % len(NOTES)], f"/sdcard/DCIM/{i}.jpg" if i % 30 == 0 else None))
+    # Stara aplikacja zapisywała dzień przez INSERT OR REPLACE - tak samo tutaj
+    conn.executemany("""
+        INSERT OR REPLACE INTO daily_logs (date, weight, waist, notes, photo_path)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+    conn.execute("""
+        INSERT INTO profile (start_date, start_weight, target_weight, height, age, intensity)
+        VALUES ('2022-12-01', 104, 80, 180, 35, 0.14)
+    """)
+    conn.execute("""
+        INSERT INTO profile (start_date, start_weight, target_weight, height, age, intensity)
+        VALUES ('2023-01-01', 100, 85, 180, 35, 0.10)
+    """)
+    conn.commit()
+    before = conn.execute("SELECT id, date, weight, waist, notes, photo_path FROM daily_logs ORDER BY id").fetchall()
+    conn.close()
+    return before
+
+
+# 400 dni i ~20 lat codziennych wpisów - migracja nie może rosnąć kwadratowo z historią
+# (trigger przeliczający całą tabelę na każdy wiersz backfillu to 20+ s przy starcie)
+@pytest.mark.parametrize("days", [400, 7300])
+def test_baseline_db_migrates_without_data_loss(tmp_path, days):
+    path = str(tmp_path / "metamorfoza_v7.db")
+    before = make_baseline_db(path, days)
+
+    conn = MojaApp.connect_db(path)
+    started = time.perf_counter()
+    MojaApp.migrate_db(conn)
+    assert time.perf_counter() - started < 5
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MojaApp.MIGRATIONS)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # Wiersze dziennika: te same id i wartości, każdy z dniem i właścicielem
+    after = conn.execute("""
+        SELECT id, date, weight, waist, notes, photo_path, day, user_id FROM daily_logs ORDER BY id
+    """).fetchall()
+    assert [r[:6] for r in after] == before
+    for r in after:
+        assert r[6] == datetime.date.fromisoformat(r[1]).toordinal()
+        assert r[7] == MojaApp.LOCAL_USER
+
+    # Z kilku profili zostaje ostatnio zapisany, przypisany do lokalnego użytkownika
+    assert conn.execute("SELECT user_id, start_weight, target_weight FROM profile").fetchall() == [
+        (MojaApp.LOCAL_USER, 100, 85)
+    ]
+
+    # Indeks FTS5 zgodny z daily_logs (rank = 1: porównanie także z tabelą źródłową)
+    conn.execute("INSERT INTO notes_fts (notes_fts, rank) VALUES ('integrity-check', 1)")
+    hits = conn.execute(MojaApp.NOTES_SEARCH_SQL, (MojaApp.fts_query("siłownia"), MojaApp.LOCAL_USER, days, 0)).fetchall()
+    assert len(hits) == sum(1 for r in before if r[4] and "siłownia" in r[4])
+
+    # Nowe wpisy po migracji dostają dzień z triggera i trafiają do indeksu
+    conn.execute("INSERT INTO daily_logs (date, weight, notes) VALUES ('2024-06-01', 88.5, 'nowy plan')")
+    conn.commit()
+    assert conn.execute("SELECT day FROM daily_logs WHERE date = '2024-06-01'").fetchone()[0] == \
+        datetime.date(2024, 6, 1).toordinal()
+    conn.execute("INSERT INTO notes_fts (notes_fts, rank) VALUES ('integrity-check', 1)")
+    conn.close()
+
+
+def test_migrate_is_noop_on_current_db(tmp_path):
+    path = str(tmp_path / "metamorfoza_v7.db")
+    make_baseline_db(path, days=30)
+    conn = MojaApp.connect_db(path)
+    MojaApp.migrate_db(conn)
+    rows = conn.execute("SELECT * FROM daily_logs ORDER BY id").fetchall()
+    schema = conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+
+    MojaApp.migrate_db(conn)
+    assert conn.execute("SELECT * FROM daily_logs ORDER BY id").fetchall() == rows
+    assert conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall() == schema
+    assert {r[0] for r in conn.execute("SELECT key FROM metric_defs")} == set(MojaApp.METRICS)
+    conn.close()